@@ -0,0 +1,296 @@
+"""
+This module provides the model backends that reviewers send their requests to.
+
+A backend turns chat messages into a Completion, or into a stream of text deltas.
+OpenAIBackend talks to the OpenAI API; FakeBackend answers locally with
+deterministic reviews after a configurable latency, so that RefactorMind can be
+benchmarked and profiled offline.
+
+Classes:
+    Completion
+    ReviewBackend
+    OpenAIBackend
+    FakeBackend
+"""
+
+import abc
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from dataclasses import dataclass
+
+import httpx
+import openai
+
+from chunking import count_tokens
+
+PACKED_FILE_MARKER = re.compile(r"^===== FILE (\d+): .* =====$", re.MULTILINE)
+
+
+@dataclass
+class Completion:
+    content: str
+    # None if the backend does not report token usage
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+
+
+class ReviewBackend(abc.ABC):
+    """Interface of a model backend.
+
+    Backends must implement complete and stream. The Batch API methods are
+    optional and only needed for --batch.
+    """
+
+    @abc.abstractmethod
+    async def complete(self, messages, model, temperature):
+        """Returns the Completion of messages."""
+
+    @abc.abstractmethod
+    async def stream(self, messages, model, temperature):
+        """Sends the request and returns an async iterator over the text deltas of the answer.
+
+        Errors of the request itself are raised here, before iteration starts.
+        """
+
+    async def upload_batch_file(self, path):
+        """Uploads a Batch API input file and returns its file id."""
+        raise NotImplementedError
+
+    async def create_batch(self, input_file_id, endpoint, completion_window):
+        """Submits the requests of an uploaded input file and returns the batch object."""
+        raise NotImplementedError
+
+    async def retrieve_batch(self, batch_id):
+        """Returns the batch object, with its status and output and error file ids."""
+        raise NotImplementedError
+
+    async def download_file(self, file_id):
+        """Returns the content of a file, such as the output file of a batch."""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class OpenAIBackend(ReviewBackend):
+    def __init__(self, client):
+        self.client = client
+
+    async def complete(self, messages, model, temperature):
+        # Modify here to use the correct API call as per your OpenAI library version
+        response = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+        )
+        usage = response.usage
+        return Completion(
+            content=response.choices[0].message.content,
+            prompt_tokens=usage.prompt_tokens if usage else None,
+            completion_tokens=usage.completion_tokens if usage else None,
+        )
+
+    async def stream(self, messages, model, temperature):
+        response = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            stream=True,
+        )
+        return self._deltas(response)
+
+    @staticmethod
+    async def _deltas(response):
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def upload_batch_file(self, path):
+        with open(path, "rb") as file:
+            uploaded = await self.client.files.create(file=file, purpose="batch")
+        return uploaded.id
+
+    # This version of the openai library has no batches resource, so the batch
+    # endpoints are called directly and their JSON is returned as is
+    async def create_batch(self, input_file_id, endpoint, completion_window):
+        response = await self.client.post(
+            "/batches",
+            body={
+                "input_file_id": input_file_id,
+                "endpoint": endpoint,
+                "completion_window": completion_window,
+            },
+            cast_to=httpx.Response,
+        )
+        return response.json()
+
+    async def retrieve_batch(self, batch_id):
+        response = await self.client.get(f"/batches/{batch_id}", cast_to=httpx.Response)
+        return response.json()
+
+    async def download_file(self, file_id):
+        content = await self.client.files.content(file_id)
+        return content.text
+
+    async def close(self):
+        await self.client.close()
+
+
+class FakeBackend(ReviewBackend):
+    """Answers every request locally with a review derived from a hash of its messages.
+
+    A request takes `latency` seconds before the first token, plus the time to
+    read the prompt at `prompt_tokens_per_second` if given, plus one second per
+    `tokens_per_second` generated tokens. A share of `error_rate` requests fails
+    with a 429 or 503 error, like the real API would. All randomness comes from
+    `seed`, so repeated runs issue the same errors in the same order. Every
+    request is recorded in `requests` as (prompt tokens, completion tokens, latency).
+    Batches are kept in memory and complete when they are first retrieved, with
+    `error_rate` of their requests failing.
+    """
+
+    def __init__(
+        self,
+        latency=0.5,
+        tokens_per_second=50.0,
+        error_rate=0.0,
+        completion_tokens=200,
+        prompt_tokens_per_second=None,
+        seed=0,
+    ):
+        self.latency = latency
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.completion_tokens = completion_tokens
+        self.random = random.Random(seed)
+        self.requests = []
+        self.errors = 0
+        # File id to content, and batch id to batch object
+        self.files = {}
+        self.batches = {}
+
+    def _review(self, messages):
+        digest = hashlib.sha256(
+            "".join(message["content"] for message in messages).encode()
+        ).hexdigest()
+        words = [f"finding-{digest[i : i + 4]}" for i in range(0, 64, 4)]
+        # Repeat the digest-derived words until the review has the configured length
+        review = " ".join(words[i % len(words)] for i in range(self.completion_tokens))
+        # Answer packed requests (see packing) with one marked review per file
+        files = PACKED_FILE_MARKER.findall(messages[-1]["content"])
+        return (
+            "\n\n".join(f"===== REVIEW {number} =====\n{review}" for number in files)
+            or review
+        )
+
+    def _maybe_fail(self):
+        if self.random.random() >= self.error_rate:
+            return
+        self.errors += 1
+        status_code = self.random.choice([429, 503])
+        request = httpx.Request("POST", "https://fake.invalid/v1/chat/completions")
+        response = httpx.Response(status_code, request=request)
+        if status_code == 429:
+            raise openai.RateLimitError("Fake rate limit", response=response, body=None)
+        raise openai.InternalServerError(
+            "Fake server error", response=response, body=None
+        )
+
+    async def _first_token(self, messages):
+        """Waits until the first token would arrive and returns the prompt's token count."""
+        prompt_tokens = sum(count_tokens(message["content"]) for message in messages)
+        delay = self.latency
+        if self.prompt_tokens_per_second:
+            delay += prompt_tokens / self.prompt_tokens_per_second
+        await asyncio.sleep(delay)
+        self._maybe_fail()
+        return prompt_tokens
+
+    async def complete(self, messages, model, temperature):
+        start = time.perf_counter()
+        prompt_tokens = await self._first_token(messages)
+        content = self._review(messages)
+        await asyncio.sleep(self.completion_tokens / self.tokens_per_second)
+        self.requests.append(
+            (prompt_tokens, self.completion_tokens, time.perf_counter() - start)
+        )
+        return Completion(content, prompt_tokens, self.completion_tokens)
+
+    async def stream(self, messages, model, temperature):
+        start = time.perf_counter()
+        prompt_tokens = await self._first_token(messages)
+        return self._deltas(self._review(messages), prompt_tokens, start)
+
+    async def _deltas(self, content, prompt_tokens, start):
+        words = content.split(" ")
+        for index, word in enumerate(words):
+            await asyncio.sleep(1 / self.tokens_per_second)
+            yield word if index == len(words) - 1 else word + " "
+        self.requests.append((prompt_tokens, len(words), time.perf_counter() - start))
+
+    def _store_file(self, content):
+        file_id = f"file-{len(self.files)}"
+        self.files[file_id] = content
+        return file_id
+
+    async def upload_batch_file(self, path):
+        with open(path) as file:
+            return self._store_file(file.read())
+
+    async def create_batch(self, input_file_id, endpoint, completion_window):
+        batch_id = f"batch-{len(self.batches)}"
+        self.batches[batch_id] = {
+            "id": batch_id,
+            "endpoint": endpoint,
+            "input_file_id": input_file_id,
+            "status": "in_progress",
+            "output_file_id": None,
+            "error_file_id": None,
+        }
+        return dict(self.batches[batch_id])
+
+    async def retrieve_batch(self, batch_id):
+        batch = self.batches[batch_id]
+        if batch["status"] == "in_progress":
+            batch["output_file_id"] = self._store_file(
+                "\n".join(
+                    json.dumps(self._batch_result(json.loads(line)))
+                    for line in self.files[batch["input_file_id"]].splitlines()
+                )
+            )
+            batch["status"] = "completed"
+        return dict(batch)
+
+    def _batch_result(self, request):
+        messages = request["body"]["messages"]
+        try:
+            self._maybe_fail()
+        except openai.APIStatusError as error:
+            response = {
+                "status_code": error.status_code,
+                "body": {"error": {"message": str(error)}},
+            }
+        else:
+            prompt_tokens = sum(
+                count_tokens(message["content"]) for message in messages
+            )
+            self.requests.append((prompt_tokens, self.completion_tokens, 0.0))
+            response = {
+                "status_code": 200,
+                "body": {
+                    "choices": [{"message": {"content": self._review(messages)}}],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": self.completion_tokens,
+                    },
+                },
+            }
+        return {"custom_id": request["custom_id"], "response": response}
+
+    async def download_file(self, file_id):
+        return self.files[file_id]
@@ -0,0 +1,296 @@
+"""
+This module keeps the state of review jobs sent through the OpenAI Batch API.
+
+A batch job reviews many files offline, at a lower price and without rate
+limits, and completes within a day. Its requests are written to a JSON Lines
+file, one chat completion request per line with a custom_id, which is uploaded
+and submitted as a batch. The job state (batch and file ids, and which requests
+review which file) is saved locally after every step, so that submitting and
+collecting can be resumed after a crash.
+
+Submitting and collecting go through the backend of a ReviewerFactory, so any
+ReviewBackend that implements the batch methods can run a job.
+
+Classes:
+    BatchRequest
+    BatchJob
+
+Functions:
+    write_requests
+    parse_results
+    requests_path
+    results_path
+    call_batch_api
+    submit_batch
+    collect_batch
+"""
+
+import asyncio
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+# Batch statuses after which the batch does not change anymore
+FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+@dataclass
+class BatchRequest:
+    """One request of a batch job, reviewing a file or a chunk (`lines`) of it."""
+
+    custom_id: str
+    cache_key: str
+    lines: list | None = None
+    # Requests whose review is cached already are not submitted
+    cached: bool = False
+
+
+@dataclass
+class BatchJob:
+    model: str
+    # File path to the requests reviewing it, in file order
+    files: dict = field(default_factory=dict)
+    input_file_id: str | None = None
+    batch_id: str | None = None
+    status: str | None = None
+    output_file_id: str | None = None
+    error_file_id: str | None = None
+
+    @property
+    def requests(self):
+        return [request for requests in self.files.values() for request in requests]
+
+    def save(self, path):
+        """Writes the job to path atomically, so a crash never leaves a partial file."""
+        state = asdict(self)
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(state, file, indent=2)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as file:
+            state = json.load(file)
+        state["files"] = {
+            file_path: [BatchRequest(**request) for request in requests]
+            for file_path, requests in state["files"].items()
+        }
+        return cls(**state)
+
+
+def write_requests(path, requests):
+    """Writes (custom_id, body) pairs as a Batch API input file."""
+    with open(path, "w") as file:
+        for custom_id, body in requests:
+            line = {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": body,
+            }
+            file.write(json.dumps(line) + "\n")
+
+
+def parse_results(text):
+    """Returns the review text of every custom_id in a Batch API output or error file.
+
+    Failed requests map to None.
+    """
+    results = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        response = result.get("response") or {}
+        body = response.get("body") or {}
+        choices = body.get("choices") or []
+        if response.get("status_code") == 200 and choices:
+            results[result["custom_id"]] = choices[0]["message"]["content"]
+        else:
+            results.setdefault(result["custom_id"], None)
+    return results
+
+
+def results_path(state_path):
+    """Where the downloaded results of the job saved at state_path are kept."""
+    path = Path(state_path)
+    return path.with_name(f"{path.stem}.results.jsonl")
+
+
+def requests_path(state_path):
+    """Where the input file of the job saved at state_path is written."""
+    path = Path(state_path)
+    return path.with_name(f"{path.stem}.requests.jsonl")
+
+
+async def call_batch_api(factory, request, logger):
+    """Awaits request() with the factory's retry policy, but without its rate limits.
+
+    Batch API calls do not count against the limits of regular requests.
+    """
+    # Imported here, as the HTTP client would slow down the startup of every run
+    from request_layer import RequestLayer
+
+    retry_policy = factory.request_layer.retry_policy if factory.request_layer else None
+
+    def on_retry(error, delay):
+        logger.warning(f"Retrying batch API call in {delay:.1f}s after: {error}")
+
+    return await RequestLayer(retry_policy=retry_policy).call(
+        request, on_retry=on_retry
+    )
+
+
+async def submit_batch(factory, file_paths, model, state_path, logger):
+    """Submits the review requests of file_paths as one Batch API job.
+
+    Reviews that are cached already are not submitted. The job is saved to
+    state_path after every step. If state_path holds a job that was not
+    submitted completely, that job is resumed instead. Returns the BatchJob.
+    """
+    backend = factory.backend
+    if os.path.exists(state_path):
+        job = BatchJob.load(state_path)
+        if job.status not in FINAL_STATUSES and job.batch_id is not None:
+            raise ValueError(
+                f"Batch '{job.batch_id}' in '{state_path}' has not finished yet, "
+                f"collect it before submitting a new one"
+            )
+        # Like collect_batch, a job without a batch or a status was never submitted;
+        # a job whose reviews were all cached is complete without a batch
+        if job.batch_id is None and job.status is None:
+            logger.info(f"Resuming the submission of the batch in '{state_path}'")
+        else:
+            job = None
+    else:
+        job = None
+
+    if job is None:
+        job = BatchJob(model)
+        results_path(state_path).unlink(missing_ok=True)
+        lines = []
+        for file_path in file_paths:
+            reviewer = factory.get_reviewer(file_path.suffix.lower())
+            try:
+                requests = reviewer.batch_requests(file_path, model)
+            except (ValueError, OSError) as error:
+                logger.error(f"Skipping '{file_path}': {error}")
+                continue
+            job.files[str(file_path)] = []
+            for key, lines_range, body in requests:
+                request = BatchRequest(
+                    f"request-{len(job.requests)}",
+                    key,
+                    lines_range,
+                    cached=bool(factory.cache and factory.cache.get(key) is not None),
+                )
+                job.files[str(file_path)].append(request)
+                if not request.cached:
+                    lines.append((request.custom_id, body))
+        if not lines:
+            job.status = "completed"
+            job.save(state_path)
+            logger.info("All reviews are cached already, nothing to submit")
+            return job
+        write_requests(requests_path(state_path), lines)
+        job.save(state_path)
+        logger.info(
+            f"Wrote {len(lines)} requests for {len(job.files)} files "
+            f"to '{requests_path(state_path)}'"
+        )
+
+    if job.input_file_id is None:
+        job.input_file_id = await call_batch_api(
+            factory,
+            lambda: backend.upload_batch_file(requests_path(state_path)),
+            logger,
+        )
+        job.save(state_path)
+    batch = await call_batch_api(
+        factory,
+        lambda: backend.create_batch(
+            job.input_file_id, BATCH_ENDPOINT, COMPLETION_WINDOW
+        ),
+        logger,
+    )
+    job.batch_id = batch["id"]
+    job.status = batch["status"]
+    job.save(state_path)
+    logger.info(f"Submitted batch '{job.batch_id}', saved to '{state_path}'")
+    return job
+
+
+async def collect_batch(factory, state_path, logger, poll_interval=None):
+    """Returns the BatchJob saved at state_path and the review of each of its files.
+
+    Reviews are None if they failed. If the batch has not finished yet, it is
+    polled every `poll_interval` seconds, or the reviews are None if that is None.
+    Results are stored in the cache, and kept next to state_path so that they are
+    only downloaded once.
+    """
+    backend = factory.backend
+    job = BatchJob.load(state_path)
+    if job.batch_id is None and job.status is None:
+        raise ValueError(f"The batch in '{state_path}' has not been submitted yet")
+    results_file = results_path(state_path)
+    while job.batch_id is not None and not results_file.exists():
+        batch = await call_batch_api(
+            factory, lambda: backend.retrieve_batch(job.batch_id), logger
+        )
+        job.status = batch["status"]
+        job.output_file_id = batch.get("output_file_id")
+        job.error_file_id = batch.get("error_file_id")
+        job.save(state_path)
+        if job.status in FINAL_STATUSES:
+            contents = [
+                await call_batch_api(
+                    factory, lambda: backend.download_file(file_id), logger
+                )
+                for file_id in (job.output_file_id, job.error_file_id)
+                if file_id
+            ]
+            with open(f"{results_file}.tmp", "w") as file:
+                file.write("\n".join(contents))
+            os.replace(f"{results_file}.tmp", results_file)
+            break
+        counts = batch.get("request_counts") or {}
+        logger.info(
+            f"Batch '{job.batch_id}' is {job.status}"
+            + (
+                f" ({counts.get('completed', 0)}/{counts.get('total', 0)} requests done)"
+                if counts
+                else ""
+            )
+        )
+        if poll_interval is None:
+            return job, None
+        await asyncio.sleep(poll_interval)
+    if job.status != "completed":
+        logger.warning(f"Batch '{job.batch_id}' ended as {job.status}")
+
+    results = parse_results(results_file.read_text()) if results_file.exists() else {}
+    reviews = {}
+    for file_path, requests in job.files.items():
+        chunk_reviews = []
+        for request in requests:
+            review_content = results.get(request.custom_id)
+            if review_content is not None and factory.cache:
+                factory.cache.put(request.cache_key, review_content)
+            elif review_content is None and factory.cache:
+                # Cached at submission, or collected before
+                review_content = factory.cache.get(request.cache_key)
+            chunk_reviews.append(review_content)
+        if None in chunk_reviews:
+            reviews[Path(file_path)] = None
+        elif requests[0].lines is None:
+            reviews[Path(file_path)] = chunk_reviews[0]
+        else:
+            reviewer = factory.get_reviewer(Path(file_path).suffix.lower())
+            reviews[Path(file_path)] = reviewer.merge_chunk_reviews(
+                [tuple(request.lines) for request in requests], chunk_reviews
+            )
+    return job, reviews
@@ -0,0 +1,85 @@
+"""
+Benchmarks review latency against file size, with and without chunking.
+
+The model is replaced by a FakeBackend whose latency grows with the prompt size,
+so the benchmark runs offline and only measures how chunking changes wall-clock
+time:
+
+    python benchmarks/chunking_benchmark.py --chunk-tokens 4000
+"""
+
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backends import FakeBackend  # noqa: E402
+from chunking import ChunkSettings, count_tokens  # noqa: E402
+from code_review import ReviewerFactory  # noqa: E402
+from language_prompts import LANGUAGE_PROMPTS  # noqa: E402
+
+
+def synthetic_python(functions):
+    return "\n\n".join(
+        f"def function_{i}(value):\n"
+        f"    total = 0\n"
+        f"    for item in range(value):\n"
+        f"        total += item * {i}\n"
+        f"    return total\n"
+        for i in range(functions)
+    )
+
+
+async def time_review(factory, file_path):
+    reviewer = factory.get_reviewer(file_path.suffix)
+    start = time.perf_counter()
+    await reviewer.review_file_async(file_path, "gpt-4-1106-preview")
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunk-tokens", type=int, default=4000)
+    parser.add_argument("--base-latency", type=float, default=0.5)
+    parser.add_argument("--tokens-per-second", type=float, default=20000)
+    parser.add_argument(
+        "--functions", type=int, nargs="+", default=[10, 100, 500, 1000, 2000]
+    )
+    args = parser.parse_args()
+
+    backend = FakeBackend(
+        latency=args.base_latency,
+        completion_tokens=0,
+        prompt_tokens_per_second=args.tokens_per_second,
+    )
+    whole = ReviewerFactory(
+        backend, LANGUAGE_PROMPTS, chunk_settings=ChunkSettings(max_tokens=10**9)
+    )
+    chunked = ReviewerFactory(
+        backend, LANGUAGE_PROMPTS, chunk_settings=ChunkSettings(args.chunk_tokens)
+    )
+
+    print(
+        f"{'lines':>8} {'tokens':>8} {'chunks':>7} {'whole (s)':>10} {'chunked (s)':>12}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for functions in args.functions:
+            source = synthetic_python(functions)
+            file_path = Path(directory) / f"synthetic_{functions}.py"
+            file_path.write_text(source)
+            reviewer = chunked.get_reviewer(".py")
+            chunks = reviewer.plan_chunks(file_path, source, "gpt-4-1106-preview")
+            whole_latency = asyncio.run(time_review(whole, file_path))
+            chunked_latency = asyncio.run(time_review(chunked, file_path))
+            print(
+                f"{len(source.splitlines()):>8} {count_tokens(source):>8} "
+                f"{len(chunks or [None]):>7} {whole_latency:>10.2f} {chunked_latency:>12.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
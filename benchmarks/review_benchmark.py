@@ -0,0 +1,229 @@
+"""
+Benchmarks and profiles the review pipeline offline, against a deterministic FakeBackend.
+
+Synthetic corpora of several sizes and languages are reviewed with the same
+scheduler, cache and request layer as a real run. For every corpus, the
+throughput, request latency percentiles, peak RSS, tokens sent and scheduling
+efficiency (the share of the concurrency slots spent waiting on the backend) are
+reported:
+
+    python benchmarks/review_benchmark.py --files 100 1000 --concurrency 16
+    python benchmarks/review_benchmark.py --cache warm --json results.json
+    python benchmarks/review_benchmark.py --files 500 --profile review.prof
+    python benchmarks/review_benchmark.py --functions-per-file 2 --pack
+"""
+
+import argparse
+import asyncio
+import cProfile
+import json
+import logging
+import random
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backends import FakeBackend  # noqa: E402
+from code_review import ReviewerFactory, review_files  # noqa: E402
+from language_prompts import LANGUAGE_PROMPTS  # noqa: E402
+from packing import DEFAULT_PACK_TOKENS  # noqa: E402
+from request_layer import RequestLayer, RetryPolicy  # noqa: E402
+from review_cache import ReviewCache  # noqa: E402
+
+LANGUAGES = [".py", ".ts", ".kt", ".cpp"]
+
+
+def synthetic_function(extension, index, rng):
+    factor = rng.randint(1, 100)
+    if extension == ".py":
+        return (
+            f"def compute_{index}(values):\n"
+            f"    total = 0\n"
+            f"    for value in values:\n"
+            f"        if value % {factor} == 0:\n"
+            f"            total += value\n"
+            f"    return total\n"
+        )
+    signature = {
+        ".ts": f"function compute{index}(values: number[]): number {{",
+        ".kt": f"fun compute{index}(values: List<Int>): Int {{",
+        ".cpp": f"int compute{index}(const std::vector<int>& values) {{",
+    }[extension]
+    declaration = {".ts": "let", ".kt": "var", ".cpp": "int"}[extension]
+    loop = {
+        ".ts": "for (const value of values) {",
+        ".kt": "for (value in values) {",
+        ".cpp": "for (int value : values) {",
+    }[extension]
+    terminator = "" if extension == ".kt" else ";"
+    return (
+        f"{signature}\n"
+        f"    {declaration} total = 0{terminator}\n"
+        f"    {loop}\n"
+        f"        if (value % {factor} == 0) {{\n"
+        f"            total += value{terminator}\n"
+        f"        }}\n"
+        f"    }}\n"
+        f"    return total{terminator}\n"
+        f"}}\n"
+    )
+
+
+def write_corpus(directory, files, languages, functions_per_file, seed):
+    """Writes a deterministic corpus of `files` source files and returns their paths."""
+    rng = random.Random(seed)
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    paths = []
+    for index in range(files):
+        extension = languages[index % len(languages)]
+        path = Path(directory) / f"module_{index:05d}{extension}"
+        functions = rng.randint(1, 2 * functions_per_file)
+        path.write_text(
+            "\n".join(synthetic_function(extension, i, rng) for i in range(functions))
+        )
+        paths.append(path)
+    return sorted(paths)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+async def review_corpus(factory, paths, model, concurrency, pack_tokens=None):
+    try:
+        return await review_files(
+            factory, paths, model, concurrency, pack_tokens=pack_tokens
+        )
+    finally:
+        await factory.close()
+
+
+def run_benchmark(args, files, directory):
+    paths = write_corpus(
+        Path(directory) / f"corpus_{files}",
+        files,
+        args.languages,
+        args.functions_per_file,
+        args.seed,
+    )
+    cache = None
+    if args.cache != "off":
+        cache = ReviewCache(str(Path(directory) / f"cache_{files}.sqlite3"))
+        if args.cache == "warm":
+            warm_factory = ReviewerFactory(
+                FakeBackend(latency=0, tokens_per_second=10**9),
+                LANGUAGE_PROMPTS,
+                cache,
+            )
+            asyncio.run(
+                review_corpus(warm_factory, paths, args.model, args.concurrency)
+            )
+            cache.hits = cache.misses = cache.stores = cache.evictions = 0
+
+    backend = FakeBackend(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        completion_tokens=args.completion_tokens,
+        seed=args.seed,
+    )
+    request_layer = RequestLayer(retry_policy=RetryPolicy(base_delay=args.retry_delay))
+    factory = ReviewerFactory(
+        backend, LANGUAGE_PROMPTS, cache, request_layer=request_layer
+    )
+    start = time.perf_counter()
+    pack_tokens = args.pack_tokens if args.pack else None
+    failures = asyncio.run(
+        review_corpus(factory, paths, args.model, args.concurrency, pack_tokens)
+    )
+    wall = time.perf_counter() - start
+
+    latencies = [latency for _, _, latency in backend.requests]
+    return {
+        "files": files,
+        "failures": failures,
+        "wall_seconds": wall,
+        "files_per_second": files / wall if wall else 0.0,
+        "requests": len(backend.requests),
+        "errors": backend.errors,
+        "retries": request_layer.retries,
+        "cache_hits": cache.hits if cache else 0,
+        "p50_latency": percentile(latencies, 0.50),
+        "p95_latency": percentile(latencies, 0.95),
+        "p99_latency": percentile(latencies, 0.99),
+        "prompt_tokens": sum(tokens for tokens, _, _ in backend.requests),
+        "efficiency": sum(latencies) / (wall * args.concurrency) if wall else 0.0,
+        # ru_maxrss is in kilobytes on Linux and only ever grows within a process
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def print_table(results):
+    columns = [
+        ("files", "files", "{:d}"),
+        ("files/s", "files_per_second", "{:.1f}"),
+        ("p50 (s)", "p50_latency", "{:.3f}"),
+        ("p95 (s)", "p95_latency", "{:.3f}"),
+        ("p99 (s)", "p99_latency", "{:.3f}"),
+        ("requests", "requests", "{:d}"),
+        ("retries", "retries", "{:d}"),
+        ("cache hits", "cache_hits", "{:d}"),
+        ("tokens sent", "prompt_tokens", "{:d}"),
+        ("efficiency", "efficiency", "{:.0%}"),
+        ("peak RSS (MB)", "peak_rss_mb", "{:.1f}"),
+    ]
+    print(" ".join(f"{title:>13}" for title, _, _ in columns))
+    for result in results:
+        print(" ".join(f"{fmt.format(result[key]):>13}" for _, key, fmt in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--languages", nargs="+", default=LANGUAGES, choices=LANGUAGES)
+    parser.add_argument("--functions-per-file", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--model", default="gpt-4-1106-preview")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0)
+    parser.add_argument("--completion-tokens", type=int, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--retry-delay", type=float, default=0.05)
+    parser.add_argument("--pack", action="store_true")
+    parser.add_argument("--pack-tokens", type=int, default=DEFAULT_PACK_TOKENS)
+    parser.add_argument("--cache", choices=["off", "cold", "warm"], default="off")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    parser.add_argument("--profile", help="Write cProfile statistics to this file")
+    args = parser.parse_args()
+
+    # Keep retry warnings and reviews out of the benchmark output
+    logging.getLogger("code_review").setLevel(logging.CRITICAL)
+
+    profiler = cProfile.Profile() if args.profile else None
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for files in args.files:
+            if profiler:
+                profiler.enable()
+            results.append(run_benchmark(args, files, directory))
+            if profiler:
+                profiler.disable()
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+    if profiler:
+        profiler.dump_stats(args.profile)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Measures how long RefactorMind takes to start, and fails if it exceeds a budget.
+
+Pre-commit hooks start RefactorMind thousands of times a day, so imports must
+stay cheap. The import time of code_review is measured with `python -X importtime`
+in fresh interpreters, together with the wall-clock time of `--help`. The run
+fails if the median import time exceeds the budget, or if a module that should
+only be imported once a review needs it is imported at startup:
+
+    python benchmarks/startup_benchmark.py --budget-ms 150
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+# Modules that code_review must only import once a review needs them
+DEFERRED_MODULES = ["openai", "httpx", "dotenv", "language_prompts"]
+
+
+def import_times(module):
+    """Returns {module: cumulative µs} for module and every module it imports.
+
+    Modules imported by the interpreter itself before module are left out.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package, where the
+        # package is indented by its depth and listed after its own imports
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:") :].split("|")
+        if name.startswith("  "):
+            times[name.strip()] = int(cumulative_us)
+        elif name.strip() == module:
+            times[module] = int(cumulative_us)
+        else:
+            # Another top-level import, so everything before it is not module's
+            times = {}
+    return times
+
+
+def help_seconds():
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "code_review.py", "--help"],
+        cwd=ROOT,
+        capture_output=True,
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=150.0)
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    args = parser.parse_args()
+
+    runs = [import_times("code_review") for _ in range(args.runs)]
+    import_ms = statistics.median(times["code_review"] for times in runs) / 1000
+    help_ms = statistics.median(help_seconds() for _ in range(args.runs)) * 1000
+
+    print(f"import code_review: {import_ms:.1f} ms (median of {args.runs})")
+    print(f"code_review.py --help: {help_ms:.1f} ms")
+    print("Slowest imports (cumulative ms):")
+    slowest = sorted(runs[-1].items(), key=lambda item: item[1], reverse=True)
+    for name, cumulative_us in slowest[1 : args.top + 1]:
+        print(f"  {cumulative_us / 1000:8.1f}  {name}")
+
+    failed = False
+    imported = [module for module in DEFERRED_MODULES if module in runs[-1]]
+    if imported:
+        print(f"FAIL: imported at startup: {', '.join(imported)}")
+        failed = True
+    if import_ms > args.budget_ms:
+        print(f"FAIL: import time exceeds the budget of {args.budget_ms:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+This module splits large source files into token-bounded chunks at syntactic boundaries.
+
+Chunks are returned as 1-based inclusive line ranges of the original file, so the
+reviews of all chunks refer to the same global line numbers.
+
+Classes:
+    ChunkSettings
+
+Functions:
+    count_tokens
+    settings_for_model
+    block_boundaries
+    split_into_chunks
+"""
+
+import ast
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+# Rough average for source code when no tokenizer is installed
+CHARS_PER_TOKEN = 4
+BRACE_LANGUAGES = {".ts", ".kt", ".cpp"}
+BRACE_NOISE = re.compile(
+    r'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`(?:\\.|[^`\\])*`',
+    re.DOTALL,
+)
+
+
+@dataclass(frozen=True)
+class ChunkSettings:
+    max_tokens: int
+    overlap_lines: int = 5
+
+
+# Chunk sizes leave room for the system prompt, the instructions and the answer
+MODEL_CHUNK_SETTINGS = {
+    "gpt-4-1106-preview": ChunkSettings(max_tokens=24000),
+    "gpt-4-turbo": ChunkSettings(max_tokens=24000),
+    "gpt-4o": ChunkSettings(max_tokens=24000),
+    "gpt-4-32k": ChunkSettings(max_tokens=12000),
+    "gpt-4": ChunkSettings(max_tokens=3000),
+    "gpt-3.5-turbo": ChunkSettings(max_tokens=6000),
+}
+DEFAULT_CHUNK_SETTINGS = ChunkSettings(max_tokens=6000)
+
+
+@lru_cache(maxsize=None)
+def _encoding(model):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text, model=None):
+    """Counts tokens with tiktoken if it is installed, otherwise estimates them."""
+    encoding = _encoding(model) if model else None
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def settings_for_model(model):
+    """Returns the chunk settings of model, matching versioned names by their longest prefix."""
+    for name in sorted(MODEL_CHUNK_SETTINGS, key=len, reverse=True):
+        if model.startswith(name):
+            return MODEL_CHUNK_SETTINGS[name]
+    return DEFAULT_CHUNK_SETTINGS
+
+
+def _python_boundaries(source):
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return []
+    boundaries = []
+    for node in tree.body:
+        decorators = getattr(node, "decorator_list", [])
+        boundaries.append(min([node.lineno] + [d.lineno for d in decorators]))
+    return boundaries
+
+
+def _brace_boundaries(source):
+    """Returns the lines that start at brace depth zero, ignoring comments and strings."""
+    # Blank out comments and string literals but keep their newlines
+    code = BRACE_NOISE.sub(lambda match: re.sub(r"[^\n]", " ", match.group()), source)
+    boundaries = []
+    depth = 0
+    for number, line in enumerate(code.splitlines(), start=1):
+        if depth == 0 and line.strip() and not line.lstrip().startswith(("}", ")")):
+            boundaries.append(number)
+        depth = max(0, depth + line.count("{") - line.count("}"))
+    return boundaries
+
+
+def block_boundaries(source, extension):
+    """Returns the line numbers at which a top-level block of source starts."""
+    if extension == ".py":
+        boundaries = _python_boundaries(source)
+    elif extension in BRACE_LANGUAGES:
+        boundaries = _brace_boundaries(source)
+    else:
+        boundaries = []
+    return sorted(set(boundaries) | {1})
+
+
+def split_into_chunks(source, extension, settings, model=None):
+    """Splits source into line ranges of at most settings.max_tokens tokens each.
+
+    Chunks end at top-level block boundaries where possible; a single block that
+    is larger than the budget is split by lines. Every chunk after the first also
+    repeats the last settings.overlap_lines lines of its predecessor as context.
+    """
+    lines = source.splitlines()
+    if not lines:
+        return []
+    # Include the "N: " prefix added to every line of a prompt
+    line_tokens = [
+        count_tokens(f"{number}: {line}\n", model)
+        for number, line in enumerate(lines, start=1)
+    ]
+    starts = block_boundaries(source, extension)
+    blocks = [
+        (start, end - 1)
+        for start, end in zip(starts, starts[1:] + [len(lines) + 1])
+        if start <= len(lines)
+    ]
+
+    ranges = []
+    chunk_start, chunk_tokens = 1, 0
+    for block_start, block_end in blocks:
+        block_tokens = sum(line_tokens[block_start - 1 : block_end])
+        if chunk_tokens and chunk_tokens + block_tokens > settings.max_tokens:
+            ranges.append((chunk_start, block_start - 1))
+            chunk_start, chunk_tokens = block_start, 0
+        if block_tokens <= settings.max_tokens:
+            chunk_tokens += block_tokens
+            continue
+        # The block alone exceeds the budget, so fall back to splitting by lines
+        for number in range(block_start, block_end + 1):
+            tokens = line_tokens[number - 1]
+            if chunk_tokens and chunk_tokens + tokens > settings.max_tokens:
+                ranges.append((chunk_start, number - 1))
+                chunk_start, chunk_tokens = number, 0
+            chunk_tokens += tokens
+    ranges.append((chunk_start, len(lines)))
+
+    return [
+        (max(1, start - settings.overlap_lines) if index else start, end)
+        for index, (start, end) in enumerate(ranges)
+    ]
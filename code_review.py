@@ -3,10 +3,13 @@ This module provides functionality to do a code review on Python code using the
 
 Classes:
     UTCFormatter
+    CodeReviewer
+    ReviewerFactory
 
 Functions:
     main
-    review_file
+    collect_files
+    review_files
 
 Constants:
     OPENAI_API_KEY (str): The OpenAI API key loaded from .env file.
@@ -15,18 +18,94 @@ Constants:
 ENV_FILE = ".env"
 
 import argparse
+import asyncio
+import contextlib
+import dataclasses
 import logging
 import os
+import signal
 import sys
 import time
-from datetime import datetime
+from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
 
-import pytz
-from dotenv import dotenv_values
-from openai import OpenAI
+from batch_api import collect_batch, submit_batch
+from chunking import (
+    CHARS_PER_TOKEN,
+    ChunkSettings,
+    count_tokens,
+    settings_for_model,
+    split_into_chunks,
+)
+from dedup import DEFAULT_THRESHOLD, find_duplicates, map_lines
+from git_diff import (
+    DEFAULT_CONTEXT_LINES,
+    changed_files,
+    expand_ranges,
+    number_excerpt,
+    parse_revision_range,
+    read_revision,
+    repository_root,
+)
+from packing import (
+    DEFAULT_PACK_TOKENS,
+    PACK_INTRODUCTION,
+    PackingStats,
+    pack_code,
+    plan_packs,
+    split_pack_review,
+)
+from pre_analysis import DEFAULT_MIN_LINES, analyze_files, git_churn, prioritize
+from review_cache import DEFAULT_MAX_AGE_DAYS, ReviewCache, make_key
+from review_daemon import DEFAULT_DEBOUNCE, PollingWatcher, ReviewDaemon
+from review_output import (
+    FINDINGS_INSTRUCTIONS,
+    create_writer,
+    display_path,
+    split_findings,
+)
+from streaming import LineBuffer, consume_stream
+from telemetry import RequestMetrics, Telemetry
 
-from language_prompts import LANGUAGE_PROMPTS
+# Third-party packages and the language prompts are imported where they are
+# first needed, so that --help and early errors do not wait for them
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_BATCH_STATE = "review_batch.json"
+TEMPERATURE = 0
+# Bump whenever construct_user_prompt changes so that cached reviews are not reused
+USER_PROMPT_VERSION = "2"
+REVIEW_INSTRUCTIONS = "Please conduct a thorough code review of the provided codebase. Focus on identifying critical improvements across the following areas, providing detailed explanations and, where possible, suggest actionable refactoring strategies:\n\n1. **Code Efficiency**: Pinpoint areas where the code could be optimized for performance. Look for common pitfalls such as unnecessarily complex algorithms, redundant code, or inefficient database queries.\n\n2. **Readability and Maintainability**: Assess the code for readability and maintainability. Recommend best practices such as consistent naming conventions, clear function and variable names, and the separation of concerns to make the code more understandable and easier to maintain.\n\n3. **Design Patterns and Architecture**: Evaluate the use of design patterns and overall architecture. Suggest refactoring opportunities that could make better use of object-oriented or functional programming principles to improve scalability and robustness.\n\n4. **Security Vulnerabilities**: Scrutinize the code for potential security vulnerabilities, such as exposure to SQL injection, cross-site scripting (XSS), or insecure data handling. Propose remedies adhering to secure coding standards.\n\n5. **Error Handling and Logging**: Highlight how the code handles exceptions and performs logging, recommending strategies to improve error reporting and resilience in the face of failures.\n\n6. **Testing and Coverage**: Comment on the current testing practices. Offer guidance on enhancing test coverage and incorporating different types of testing like unit, integration, and end-to-end tests, as appropriate.\n\n7. **Compliance with Best Practices and Standards**: Check for adherence to the language-specific and industry-wide best practices, including commenting, documentation, and code formatting standards.\n\n8. **Technical Debt Identification**: Identify any ‘quick fixes’ or temporary solutions that have resulted in technical debt, and suggest a prioritized plan for addressing these issues.\n\n9. **Dependencies Management**: Review any third-party libraries or dependencies for appropriateness, licensing issues, and ensure that they are up to date and maintained.\n\n10. **Code Patterns and Anti-Patterns**: Call out any anti-patterns and suggest alternative approaches or patterns that could enhance the overall quality and functionality of the code.\n\nBy targeting these specific areas, provide insights into optimizations, potential refactoring, improved practices, and preventative measures to enhance the quality, maintainability, and security of the provided codebase.\n\nPlease note that each line in the code starts with a line number then a colon and a space. Try to use the line number when referencing every code line or at least the start of the code block."
+# How construct_user_prompt introduces the code, depending on which part of a file is sent
+PROMPT_INTRODUCTIONS = {
+    "file": "I have the following code",
+    "changes": "I have the following excerpts of changed code. Unchanged lines were omitted and are marked with a line containing only '...', so focus the review on the shown lines",
+    "chunk": "I have the following part of a larger file. The rest of the file was omitted and is marked with a line containing only '...'",
+}
+
+
+# File extension to the CodeReviewer subclass reviewing it, see register_reviewer
+REVIEWER_CLASSES = {}
+
+
+def register_reviewer(*extensions):
+    """Class decorator registering a CodeReviewer subclass for these file extensions."""
+
+    def register(reviewer_class):
+        for extension in extensions:
+            REVIEWER_CLASSES[extension] = reviewer_class
+        return reviewer_class
+
+    return register
+
+
+@lru_cache(maxsize=None)
+def default_language_prompts():
+    """Returns the system prompts of language_prompts, imported on first use."""
+    from language_prompts import LANGUAGE_PROMPTS
+
+    return LANGUAGE_PROMPTS
 
 
 class UTCFormatter(logging.Formatter):
@@ -34,7 +113,7 @@ class UTCFormatter(logging.Formatter):
 
     def formatTime(self, record, datefmt=None):
         # Convert log record creation time to UTC
-        record_utc = datetime.utcfromtimestamp(record.created).replace(tzinfo=pytz.utc)
+        record_utc = datetime.fromtimestamp(record.created, timezone.utc)
         if datefmt:
             s = record_utc.strftime(datefmt)
         else:
@@ -43,56 +122,431 @@ class UTCFormatter(logging.Formatter):
 
 
 class CodeReviewer:
-    def __init__(self, client, language_prompts):
-        self.client = client
+    def __init__(
+        self,
+        backend,
+        language_prompts=None,
+        cache=None,
+        chunk_settings=None,
+        stream=False,
+        request_layer=None,
+        structured=False,
+        telemetry=None,
+    ):
+        self.backend = backend
         self.language_prompts = language_prompts
+        self.cache = cache
+        # None means the chunk settings of the model being used
+        self.chunk_settings = chunk_settings
+        self.stream = stream
+        self.request_layer = request_layer
+        # Whether to ask for a machine-readable findings block after the review
+        self.structured = structured
+        self.telemetry = telemetry
 
     def detect_language(self, file_path):
         ext = file_path.suffix.lower()
-        if ext in self.language_prompts:
-            return self.language_prompts[ext]
+        language_prompts = self.language_prompts or default_language_prompts()
+        if ext in language_prompts:
+            return language_prompts[ext]
         raise ValueError("Unsupported file type")
 
+    @staticmethod
+    def read_source(file_path):
+        with open(file_path, "r") as file:
+            return file.read()
+
+    @staticmethod
+    def number_lines(code_content):
+        # Add line numbers to each line
+        lines = code_content.splitlines()
+        return "\n".join(f"{i + 1}: {line}" for i, line in enumerate(lines))
+
+    def build_messages(self, prompt, source, line_ranges=None, scope="file"):
+        """Builds the request messages, limited to line_ranges of source if given."""
+        if line_ranges is None:
+            code_content = self.number_lines(source)
+        else:
+            code_content = number_excerpt(source, line_ranges)
+        return [
+            prompt,
+            self.construct_user_prompt(
+                code_content, self.get_tag(), scope, self.structured
+            ),
+        ]
+
+    def cache_key(self, prompt, source, model, line_ranges=None, scope="file"):
+        version = (
+            f"{USER_PROMPT_VERSION}-findings"
+            if self.structured
+            else USER_PROMPT_VERSION
+        )
+        if scope != "file":
+            version = f"{version}-{scope}"
+        if line_ranges is not None:
+            # Only the excerpt is sent, so changes outside of it do not affect the review
+            source = number_excerpt(source, line_ranges)
+        return make_key(source, prompt["content"], version, model, TEMPERATURE)
+
+    def plan_chunks(self, file_path, source, model):
+        """Returns the line ranges to review source in, or None if it fits one request."""
+        settings = self.chunk_settings or settings_for_model(model)
+        if count_tokens(source, model) <= settings.max_tokens:
+            return None
+        chunks = split_into_chunks(source, file_path.suffix.lower(), settings, model)
+        return chunks if len(chunks) > 1 else None
+
+    def batch_requests(self, file_path, model):
+        """Returns the requests reviewing file_path, as (cache key, lines, body).
+
+        Large files are split into chunks like in review_file_async, with `lines`
+        the [start, end] of each chunk; otherwise `lines` is None.
+        """
+        prompt = self.detect_language(file_path)
+        source = self.read_source(file_path)
+        chunks = self.plan_chunks(file_path, source, model)
+
+        def body(messages):
+            return {"model": model, "messages": messages, "temperature": TEMPERATURE}
+
+        if chunks is None:
+            return [
+                (
+                    self.cache_key(prompt, source, model),
+                    None,
+                    body(self.build_messages(prompt, source)),
+                )
+            ]
+        return [
+            (
+                self.cache_key(prompt, source, model, [(start, end)], "chunk"),
+                [start, end],
+                body(self.build_messages(prompt, source, [(start, end)], "chunk")),
+            )
+            for start, end in chunks
+        ]
+
     def review_file(self, file_path, model):
+        """Reviews file_path and logs the review."""
+        logger = logging.getLogger(__name__)
+        logger.info(f"tag = {self.get_tag()}")
+        review_content = asyncio.run(self.review_file_async(file_path, model))
+        if review_content is None:
+            return False
+        if not self.stream:
+            self.log_review(review_content)
+        return True
+
+    async def review_file_async(
+        self,
+        file_path,
+        model,
+        source=None,
+        line_ranges=None,
+        semaphore=None,
+        label=None,
+    ):
+        """Requests a review from the backend and returns its text, or None on failure.
+
+        Nothing is logged on success so that the caller can emit the reviews of a
+        batch in a stable order, unless streaming is enabled: then every line is
+        logged as it arrives, prefixed by `label` if given. `source` overrides the
+        content on disk and `line_ranges` restricts the review to those lines of it.
+        Files that are too large for one request are reviewed in chunks
+        concurrently and the chunk reviews are merged. `semaphore` limits the
+        number of requests in flight.
+        """
+        logger = logging.getLogger(__name__)
         try:
-            logger = logging.getLogger(__name__)
             prompt = self.detect_language(file_path)
-            with open(file_path, "r") as file:
-                code_content = file.read()
-                # Add line numbers to each line
-                lines = code_content.splitlines()
-                code_content = "\n".join(
-                    f"{i + 1}: {line}" for i, line in enumerate(lines)
+            if source is None:
+                source = self.read_source(file_path)
+            if line_ranges is not None:
+                return await self.request_review(
+                    prompt,
+                    source,
+                    model,
+                    line_ranges,
+                    "changes",
+                    semaphore,
+                    label,
+                    file_path,
+                )
+            chunks = self.plan_chunks(file_path, source, model)
+            if chunks is None:
+                return await self.request_review(
+                    prompt,
+                    source,
+                    model,
+                    semaphore=semaphore,
+                    label=label,
+                    file_path=file_path,
+                )
+            logger.info(f"Reviewing '{file_path}' in {len(chunks)} chunks")
+            reviews = await asyncio.gather(
+                *(
+                    self.request_review(
+                        prompt,
+                        source,
+                        model,
+                        [(start, end)],
+                        "chunk",
+                        semaphore,
+                        f"{label or file_path.name} lines {start}-{end}",
+                        file_path,
+                    )
+                    for start, end in chunks
                 )
-
-            tag = self.get_tag()
-            logger.info(f"tag = {tag}")
-
-            # Modify here to use the correct API call as per your OpenAI library version
-            response = self.client.chat.completions.create(
-                model=model,
-                # ... Other parameters ...
-                messages=[prompt, self.construct_user_prompt(code_content, tag)],
-                temperature=0,
             )
-
-            self.log_review(response.choices[0].message.content)
+            return self.merge_chunk_reviews(chunks, reviews)
         except ValueError as ve:
-            logger.error(f"Value Error: {ve}")
-            return False
+            logger.error(f"Value Error in '{file_path}': {ve}")
         except OSError as ose:
-            logger.error(f"OS Error: {ose}")
-            return False
+            logger.error(f"OS Error in '{file_path}': {ose}")
         except Exception as e:
-            logger.error(f"An unexpected error occurred: {e}", exc_info=True)
-            return False
-        return True
+            logger.error(
+                f"An unexpected error occurred in '{file_path}': {e}", exc_info=True
+            )
+        return None
+
+    async def review_pack_async(self, file_paths, model, semaphore=None, stats=None):
+        """Reviews several small files of this language in one request.
+
+        Returns their reviews in order, with None for every failed review. Files
+        whose review cannot be found in the answer are reviewed on their own. The
+        prompt tokens of the packed request, compared with one request per file,
+        are added to `stats` if given.
+        """
+        logger = logging.getLogger(__name__)
+        reviews = [None] * len(file_paths)
+        try:
+            prompt = self.detect_language(file_paths[0])
+        except ValueError as ve:
+            logger.error(f"Value Error in '{file_paths[0]}': {ve}")
+            return reviews
+        pending = []
+        for index, file_path in enumerate(file_paths):
+            try:
+                source = self.read_source(file_path)
+            except OSError as ose:
+                logger.error(f"OS Error in '{file_path}': {ose}")
+                continue
+            key = self.cache_key(prompt, source, model, scope="packed")
+            reviews[index] = self.cache.get(key) if self.cache else None
+            if reviews[index] is None:
+                pending.append((index, file_path, source, key))
+            elif self.telemetry:
+                self.telemetry.record_cache_hit(file_path, self.get_tag())
+
+        if len(pending) > 1:
+            files = [
+                (display_path(file_path), self.number_lines(source))
+                for _, file_path, source, _ in pending
+            ]
+            messages = [
+                prompt,
+                self.construct_packed_prompt(files, self.get_tag(), self.structured),
+            ]
+            label = f"pack of {len(pending)} {self.get_tag()} files"
+            try:
+                async with semaphore or contextlib.nullcontext():
+                    with self.measure_request(
+                        [file_path for _, file_path, _, _ in pending], model
+                    ) as metrics:
+                        completion = await self.create_completion(
+                            messages, model, label, metrics=metrics
+                        )
+                packed_reviews = split_pack_review(completion.content, len(pending))
+            except Exception as e:
+                logger.error(f"Review of {label} failed: {e}", exc_info=True)
+                packed_reviews = [None] * len(pending)
+            for (index, _, _, key), review_content in zip(pending, packed_reviews):
+                reviews[index] = review_content
+                if review_content is not None and self.cache:
+                    self.cache.put(key, review_content)
+            if stats is not None:
+                single_tokens = [
+                    sum(
+                        count_tokens(message["content"], model)
+                        for message in self.build_messages(prompt, source)
+                    )
+                    for _, _, source, _ in pending
+                ]
+                stats.requests += 1
+                stats.files += len(pending)
+                stats.single_tokens += sum(single_tokens)
+                # Files reviewed on their own below are sent a second time
+                stats.packed_tokens += sum(
+                    count_tokens(message["content"], model) for message in messages
+                ) + sum(
+                    tokens
+                    for (index, _, _, _), tokens in zip(pending, single_tokens)
+                    if reviews[index] is None
+                )
+            pending = [item for item in pending if reviews[item[0]] is None]
+
+        for index, file_path, source, _ in pending:
+            reviews[index] = await self.review_file_async(
+                file_path, model, source, semaphore=semaphore
+            )
+        return reviews
+
+    async def request_review(
+        self,
+        prompt,
+        source,
+        model,
+        line_ranges=None,
+        scope="file",
+        semaphore=None,
+        label=None,
+        file_path=None,
+    ):
+        """Returns the cached review of the given part of source, or requests a new one.
+
+        The request, failed or not, is accounted to file_path in the telemetry, if any.
+        """
+        key = self.cache_key(prompt, source, model, line_ranges, scope)
+        review_content = self.cache.get(key) if self.cache else None
+        if review_content is not None:
+            if self.telemetry:
+                self.telemetry.record_cache_hit(file_path, self.get_tag())
+            if self.stream:
+                LineBuffer(self.stream_emitter(label)).write(review_content + "\n")
+            return review_content
+        messages = self.build_messages(prompt, source, line_ranges, scope)
+        async with semaphore or contextlib.nullcontext():
+            with self.measure_request([file_path], model) as metrics:
+                if self.stream:
+                    review_content = await self.stream_review(
+                        messages, model, label, metrics
+                    )
+                else:
+                    completion = await self.create_completion(
+                        messages, model, label, metrics=metrics
+                    )
+                    review_content = completion.content
+        if self.cache:
+            self.cache.put(key, review_content)
+        return review_content
+
+    @contextlib.contextmanager
+    def measure_request(self, file_paths, model):
+        """Yields RequestMetrics that are recorded in the telemetry once the request ends.
+
+        Failed requests are recorded as well, with their retries and latency.
+        """
+        metrics = RequestMetrics()
+        start = time.perf_counter()
+        try:
+            yield metrics
+        except Exception:
+            metrics.failed = True
+            raise
+        finally:
+            metrics.latency = time.perf_counter() - start
+            if self.telemetry:
+                self.telemetry.record_request(
+                    file_paths, self.get_tag(), model, metrics
+                )
+
+    async def create_completion(
+        self, messages, model, label=None, stream=False, metrics=None
+    ):
+        """Sends a request to the backend through the shared request layer, if any.
+
+        Returns a Completion, or an async iterator over text deltas if `stream`.
+        Retries and, for a Completion, its tokens are recorded in `metrics` if
+        given; the prompt tokens are estimated until the backend reports them.
+        """
+        logger = logging.getLogger(__name__)
+
+        def request():
+            send = self.backend.stream if stream else self.backend.complete
+            return send(messages, model, TEMPERATURE)
+
+        def on_retry(error, delay):
+            if metrics is not None:
+                metrics.retries += 1
+            logger.warning(
+                f"Retrying request{f' for {label}' if label else ''} "
+                f"in {delay:.1f}s after: {error}"
+            )
+
+        prompt_tokens = sum(
+            count_tokens(message["content"], model) for message in messages
+        )
+        if metrics is not None:
+            metrics.prompt_tokens = prompt_tokens
+            metrics.estimated = True
+        if self.request_layer is None:
+            response = await request()
+        else:
+            response = await self.request_layer.call(request, prompt_tokens, on_retry)
+        if metrics is not None and not stream:
+            metrics.completion_tokens = count_tokens(response.content, model)
+            if response.prompt_tokens is not None:
+                metrics.prompt_tokens = response.prompt_tokens
+                metrics.completion_tokens = response.completion_tokens
+                metrics.estimated = False
+        return response
+
+    async def stream_review(self, messages, model, label=None, metrics=None):
+        """Logs the review line by line as it is generated and returns its full text.
+
+        Streamed answers do not report usage, so `metrics` gets estimated tokens.
+        """
+        logger = logging.getLogger(__name__)
+        start = time.perf_counter()
+        stream = await self.create_completion(
+            messages, model, label, stream=True, metrics=metrics
+        )
+        review_content, stats = await consume_stream(
+            stream, self.stream_emitter(label), start
+        )
+        if metrics is not None:
+            metrics.completion_tokens = stats.tokens
+        logger.info(
+            f"Streamed review{f' of {label}' if label else ''}: "
+            f"first token after {stats.time_to_first_token:.2f}s, "
+            f"{stats.tokens} tokens at {stats.tokens_per_second:.1f} tokens/s, "
+            f"{stats.total_latency:.2f}s total"
+        )
+        return review_content
 
     @staticmethod
-    def construct_user_prompt(code_content, tag):
+    def stream_emitter(label=None):
+        logger = logging.getLogger(__name__)
+        if label is None:
+            return logger.info
+        return lambda line: logger.info(f"[{label}] {line}")
+
+    @staticmethod
+    def merge_chunk_reviews(chunks, reviews):
+        return "\n\n".join(
+            f"## Lines {start}-{end}\n\n{review}"
+            for (start, end), review in zip(chunks, reviews)
+        )
+
+    @staticmethod
+    def construct_user_prompt(code_content, tag, scope="file", structured=False):
+        # The instructions come first and the code last, so that all requests of a
+        # run share the longest possible prefix for provider-side prompt caching
+        introduction = PROMPT_INTRODUCTIONS[scope]
+        findings = FINDINGS_INSTRUCTIONS if structured else ""
         return {
             "role": "user",
-            "content": f"I have the following code:\n\n```{tag}\n{code_content}\n```\n\nPlease conduct a thorough code review of the provided codebase. Focus on identifying critical improvements across the following areas, providing detailed explanations and, where possible, suggest actionable refactoring strategies:\n\n1. **Code Efficiency**: Pinpoint areas where the code could be optimized for performance. Look for common pitfalls such as unnecessarily complex algorithms, redundant code, or inefficient database queries.\n\n2. **Readability and Maintainability**: Assess the code for readability and maintainability. Recommend best practices such as consistent naming conventions, clear function and variable names, and the separation of concerns to make the code more understandable and easier to maintain.\n\n3. **Design Patterns and Architecture**: Evaluate the use of design patterns and overall architecture. Suggest refactoring opportunities that could make better use of object-oriented or functional programming principles to improve scalability and robustness.\n\n4. **Security Vulnerabilities**: Scrutinize the code for potential security vulnerabilities, such as exposure to SQL injection, cross-site scripting (XSS), or insecure data handling. Propose remedies adhering to secure coding standards.\n\n5. **Error Handling and Logging**: Highlight how the code handles exceptions and performs logging, recommending strategies to improve error reporting and resilience in the face of failures.\n\n6. **Testing and Coverage**: Comment on the current testing practices. Offer guidance on enhancing test coverage and incorporating different types of testing like unit, integration, and end-to-end tests, as appropriate.\n\n7. **Compliance with Best Practices and Standards**: Check for adherence to the language-specific and industry-wide best practices, including commenting, documentation, and code formatting standards.\n\n8. **Technical Debt Identification**: Identify any ‘quick fixes’ or temporary solutions that have resulted in technical debt, and suggest a prioritized plan for addressing these issues.\n\n9. **Dependencies Management**: Review any third-party libraries or dependencies for appropriateness, licensing issues, and ensure that they are up to date and maintained.\n\n10. **Code Patterns and Anti-Patterns**: Call out any anti-patterns and suggest alternative approaches or patterns that could enhance the overall quality and functionality of the code.\n\nBy targeting these specific areas, provide insights into optimizations, potential refactoring, improved practices, and preventative measures to enhance the quality, maintainability, and security of the provided codebase.\n\nPlease note that each line in the code starts with a line number then a colon and a space. Try to use the line number when referencing every code line or at least the start of the code block.",
+            "content": f"{REVIEW_INSTRUCTIONS}{findings}\n\n{introduction}:\n\n```{tag}\n{code_content}\n```",
+        }
+
+    @staticmethod
+    def construct_packed_prompt(files, tag, structured=False):
+        """Like construct_user_prompt, for several (name, numbered code) files at once."""
+        introduction = PACK_INTRODUCTION.format(count=len(files))
+        findings = FINDINGS_INSTRUCTIONS if structured else ""
+        return {
+            "role": "user",
+            "content": f"{REVIEW_INSTRUCTIONS}{findings}\n\n{introduction}:\n\n{pack_code(tag, files)}",
         }
 
     def log_review(self, review_content):
@@ -100,43 +554,249 @@ class CodeReviewer:
         logger.info(f"Review Content:\n{review_content}")
 
 
+@register_reviewer(".py")
 class PythonReviewer(CodeReviewer):
     def get_tag(self):
         return "python"
 
 
+@register_reviewer(".ts")
 class TypeScriptReviewer(CodeReviewer):
     def get_tag(self):
         return "typescript"
 
 
+@register_reviewer(".kt")
 class KotlinReviewer(CodeReviewer):
     def get_tag(self):
         return "kotlin"
 
 
+@register_reviewer(".cpp")
 class CppReviewer(CodeReviewer):
     def get_tag(self):
         return "cpp"
 
 
 class ReviewerFactory:
-    def __init__(self, client, language_prompts):
-        self.client = client
+    """Creates the reviewer registered for a file extension, sharing one backend.
+
+    `language_prompts` maps extensions to system prompts; None means the prompts
+    of language_prompts, which are only imported once a review needs one.
+    """
+
+    def __init__(
+        self,
+        backend,
+        language_prompts=None,
+        cache=None,
+        chunk_settings=None,
+        stream=False,
+        request_layer=None,
+        structured=False,
+        telemetry=None,
+    ):
+        # The backend and request layer are shared by all reviewers, so that every
+        # request uses the same connection pool and counts against the same limits
+        self.backend = backend
         self.language_prompts = language_prompts
-        self.reviewer_classes = {
-            ".py": PythonReviewer,
-            ".ts": TypeScriptReviewer,
-            ".kt": KotlinReviewer,
-            ".cpp": CppReviewer,
-            # extend with more as needed...
-        }
+        self.cache = cache
+        self.chunk_settings = chunk_settings
+        self.stream = stream
+        self.request_layer = request_layer
+        self.structured = structured
+        self.telemetry = telemetry
 
     def get_reviewer(self, file_extension):
-        reviewer_class = self.reviewer_classes.get(file_extension)
+        reviewer_class = REVIEWER_CLASSES.get(file_extension)
         if reviewer_class is None:
             raise ValueError(f"Unsupported file type: {file_extension}")
-        return reviewer_class(self.client, self.language_prompts)
+        return reviewer_class(
+            self.backend,
+            self.language_prompts,
+            self.cache,
+            self.chunk_settings,
+            self.stream,
+            self.request_layer,
+            self.structured,
+            self.telemetry,
+        )
+
+    def supported_extensions(self):
+        return set(REVIEWER_CLASSES)
+
+    async def close(self):
+        """Closes the pooled connections of the shared backend and flushes the cache."""
+        if self.cache:
+            self.cache.flush()
+        await self.backend.close()
+
+
+async def run_and_close(factory, coroutine):
+    try:
+        return await coroutine
+    finally:
+        await factory.close()
+
+
+def collect_files(root, pattern, extensions):
+    """Returns the supported files below root matching pattern, in a stable order.
+
+    Hidden files and directories (such as .git or .venv) are skipped.
+    """
+    if root.is_file():
+        return [root]
+    return sorted(
+        path
+        for path in root.rglob(pattern)
+        if path.is_file()
+        and path.suffix.lower() in extensions
+        and not any(part.startswith(".") for part in path.relative_to(root).parts)
+    )
+
+
+async def review_files(
+    factory,
+    file_paths,
+    model,
+    concurrency=DEFAULT_CONCURRENCY,
+    excerpts=None,
+    writer=None,
+    duplicates=None,
+    pack_tokens=None,
+):
+    """Reviews file_paths concurrently and logs the reviews in input order.
+
+    At most `concurrency` requests are in flight at once, including the chunk
+    requests of large files. A review is logged as soon as it and all reviews
+    before it have completed, so output order does not depend on which request
+    finishes first. With streaming enabled, reviews are logged line by line as
+    they arrive instead. `excerpts` optionally maps a file path to the
+    (source, line_ranges) to review instead of the whole file on disk.
+    If a writer from review_output is given, the findings of every review are
+    written to it in the same order. `duplicates` optionally maps a file path to
+    the DuplicateGroup it represents; the group's members reuse its review.
+    With `pack_tokens`, small whole files of the same language are reviewed
+    together in requests of up to that many tokens (not while streaming).
+    Returns the number of failed reviews, counting the members of failed groups.
+    """
+    logger = logging.getLogger(__name__)
+    semaphore = asyncio.Semaphore(concurrency)
+    excerpts = excerpts or {}
+    duplicates = duplicates or {}
+
+    async def review(file_path):
+        reviewer = factory.get_reviewer(file_path.suffix.lower())
+        source, line_ranges = excerpts.get(file_path, (None, None))
+        return await reviewer.review_file_async(
+            file_path, model, source, line_ranges, semaphore, str(file_path)
+        )
+
+    packs = []
+    packing_stats = PackingStats()
+    if pack_tokens and not factory.stream:
+        packs = plan_packs(
+            [
+                # The file size is a good enough estimate to plan with
+                (file_path, file_path.stat().st_size // CHARS_PER_TOKEN)
+                for file_path in file_paths
+                if file_path not in excerpts
+            ],
+            pack_tokens,
+        )
+
+    # Every file maps to a task returning its review, or a list of reviews of its pack
+    tasks = {}
+    for pack in packs:
+        reviewer = factory.get_reviewer(pack.extension)
+        task = asyncio.create_task(
+            reviewer.review_pack_async(pack.file_paths, model, semaphore, packing_stats)
+        )
+        for index, file_path in enumerate(pack.file_paths):
+            tasks[file_path] = (task, index)
+    for file_path in file_paths:
+        if file_path not in tasks:
+            tasks[file_path] = (asyncio.create_task(review(file_path)), None)
+
+    failures = 0
+    for file_path in file_paths:
+        task, index = tasks[file_path]
+        review_content = await task
+        if index is not None:
+            review_content = review_content[index]
+        group = duplicates.get(file_path)
+        members = group.members() if group else []
+        if review_content is None:
+            failures += 1 + len(members)
+            continue
+        if writer is not None:
+            review_content, findings = split_findings(
+                review_content, display_path(file_path)
+            )
+            writer.write(findings)
+            for member in members:
+                writer.write(duplicate_findings(findings, group, member))
+        if not factory.stream:
+            if file_path in excerpts:
+                ranges = ", ".join(
+                    f"{start}-{end}" for start, end in excerpts[file_path][1]
+                )
+                logger.info(f"Review of '{file_path}' (lines {ranges})")
+            else:
+                logger.info(f"Review of '{file_path}'")
+            factory.get_reviewer(file_path.suffix.lower()).log_review(review_content)
+        if group:
+            log_duplicates(group)
+    if packing_stats.requests:
+        logger.info(
+            f"Packed {packing_stats.files} files into {packing_stats.requests} "
+            f"request(s), saving {packing_stats.saved_ratio:.0%} of prompt tokens"
+        )
+    return failures
+
+
+def duplicate_findings(findings, group, member):
+    """Returns the findings of the group representative's review for member.
+
+    Line ranges carry over to exact copies as they are. For near-duplicates they
+    are mapped through a line diff, and left out where either end does not map.
+    """
+    if member in group.copies:
+        return [
+            dataclasses.replace(finding, file=display_path(member))
+            for finding in findings
+        ]
+    mapping = map_lines(
+        CodeReviewer.read_source(group.representative),
+        CodeReviewer.read_source(member),
+    )
+    member_findings = []
+    for finding in findings:
+        start_line = mapping.get(finding.start_line)
+        end_line = mapping.get(finding.end_line or finding.start_line)
+        if start_line is None or end_line is None:
+            start_line = end_line = None
+        member_findings.append(
+            dataclasses.replace(
+                finding,
+                file=display_path(member),
+                start_line=start_line,
+                end_line=end_line,
+            )
+        )
+    return member_findings
+
+
+def log_duplicates(group):
+    logger = logging.getLogger(__name__)
+    for copy in group.copies:
+        logger.info(f"Review of '{copy}': identical to '{group.representative}'")
+    for path, score in group.near_duplicates:
+        logger.info(
+            f"Review of '{path}': near-duplicate of '{group.representative}' "
+            f"(about {score:.0%} similar), whose review applies but whose line "
+            f"numbers may differ"
+        )
 
 
 def setup_logging(log_file):
@@ -167,19 +827,21 @@ def setup_logging(log_file):
     return logger
 
 
-def initialize_configuration():
+def initialize_configuration(require_api_key=True):
     """Initializes the application configuration from .env file and sets up logging."""
     if not os.path.exists(ENV_FILE):
         logging.error("Error: .env file not found.")
         sys.exit(1)
 
+    from dotenv import dotenv_values
+
     config = dotenv_values(ENV_FILE)
 
     OPENAI_API_KEY = config.get("OPENAI_API_KEY")
     OPENAI_MODEL = config.get("OPENAI_MODEL", "gpt-4-1106-preview")
     LOG_FILE = config.get("LOG_FILE", "application.log")
 
-    if not OPENAI_API_KEY:
+    if require_api_key and not OPENAI_API_KEY:
         logging.error("Error: OPENAI_API_KEY not found in .env file.")
         sys.exit(1)
 
@@ -189,47 +851,616 @@ def initialize_configuration():
 
     setup_logging(LOG_FILE)
 
-    return OPENAI_API_KEY, OPENAI_MODEL, LOG_FILE
+    return OPENAI_API_KEY, OPENAI_MODEL, LOG_FILE, config
 
 
 def parse_arguments():
     parser = argparse.ArgumentParser(
         description="Review Python code using the GPT-4 Turbo API"
     )
-    parser.add_argument("--file", type=str, help="The input file path", required=True)
-    return parser.parse_args()
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--file", type=str, help="The input file path")
+    target.add_argument(
+        "--path", type=str, help="A directory to review all supported files in"
+    )
+    target.add_argument(
+        "--diff",
+        type=str,
+        metavar="BASE..HEAD",
+        help="Only review the lines changed between two git revisions "
+        "(an empty HEAD means the working tree; BASE...HEAD compares HEAD "
+        "with the merge base of both)",
+    )
+    target.add_argument(
+        "--watch",
+        type=str,
+        metavar="DIRECTORY",
+        help="Keep running and review supported files below DIRECTORY whenever they change",
+    )
+    parser.add_argument(
+        "--serve",
+        type=str,
+        metavar="SOCKET",
+        help="Keep running and review files submitted on this Unix socket "
+        "(see review_client.py); can be combined with --watch",
+    )
+    parser.add_argument(
+        "--batch",
+        choices=["submit", "collect"],
+        help="'submit' sends the reviews of --file or --path as one job to the "
+        "Batch API, 'collect' logs and writes the reviews of the submitted job",
+    )
+    parser.add_argument(
+        "--batch-state",
+        type=str,
+        default=DEFAULT_BATCH_STATE,
+        help=f"Where --batch keeps the state of its job (default: {DEFAULT_BATCH_STATE})",
+    )
+    parser.add_argument(
+        "--batch-wait",
+        type=float,
+        metavar="SECONDS",
+        help="Let --batch collect wait for an unfinished job, checking every SECONDS",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=DEFAULT_DEBOUNCE,
+        help=f"Seconds a file must stay unchanged before --watch reviews it (default: {DEFAULT_DEBOUNCE})",
+    )
+    parser.add_argument(
+        "--context",
+        type=int,
+        default=DEFAULT_CONTEXT_LINES,
+        help=f"Unchanged lines to include around each change in --diff mode (default: {DEFAULT_CONTEXT_LINES})",
+    )
+    parser.add_argument(
+        "--glob",
+        type=str,
+        default="*",
+        help="Only review files below --path matching this pattern (default: all)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"Maximum number of concurrent reviews in --path and --diff mode (default: {DEFAULT_CONCURRENCY})",
+    )
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="In --path mode, review only one file of every group of identical or "
+        "near-identical files and reuse its review for the others",
+    )
+    parser.add_argument(
+        "--dedup-threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help=f"Estimated similarity from which --dedup treats files as near-identical (default: {DEFAULT_THRESHOLD})",
+    )
+    parser.add_argument(
+        "--triage",
+        action="store_true",
+        help="In --path mode, analyze files locally first: skip trivial ones "
+        "and review the riskiest (complex, large, often changed) first",
+    )
+    parser.add_argument(
+        "--min-lines",
+        type=int,
+        default=DEFAULT_MIN_LINES,
+        help=f"--triage skips files with fewer code lines (default: {DEFAULT_MIN_LINES})",
+    )
+    parser.add_argument(
+        "--min-complexity",
+        type=int,
+        default=1,
+        help="--triage skips files with a lower cyclomatic complexity (default: 1)",
+    )
+    parser.add_argument(
+        "--token-budget",
+        type=int,
+        help="--triage only reviews the riskiest files whose estimated prompt "
+        "tokens fit into this budget",
+    )
+    parser.add_argument(
+        "--analysis-workers",
+        type=int,
+        help="Processes for --triage and --dedup (default: the number of CPUs)",
+    )
+    parser.add_argument(
+        "--pack",
+        action="store_true",
+        help="In --path mode, review several small files of the same language "
+        "in one request, sending the shared instructions only once",
+    )
+    parser.add_argument(
+        "--pack-tokens",
+        type=int,
+        default=DEFAULT_PACK_TOKENS,
+        help=f"Maximum estimated tokens of code per --pack request (default: {DEFAULT_PACK_TOKENS})",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Log reviews line by line while they are generated and report "
+        "time to first token (in --path and --diff mode, lines of different "
+        "files interleave and are prefixed with the file)",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        help="Also write the findings of every review to this file as they are produced",
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=["jsonl", "sarif"],
+        help="Format of --output (default: sarif if the file name contains "
+        "'.sarif', otherwise jsonl)",
+    )
+    parser.add_argument(
+        "--metrics-json",
+        type=str,
+        help="Write the tokens, estimated cost and latency of the run, per "
+        "file, language and model, to this JSON file",
+    )
+    parser.add_argument(
+        "--metrics-prom",
+        type=str,
+        help="Write the per-language and per-model totals of the run to this "
+        "file in the Prometheus text format, e.g. for the node_exporter "
+        "textfile collector",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["openai", "fake"],
+        default="openai",
+        help="Where requests go: 'fake' answers them locally with generated "
+        "reviews, e.g. to try options or measure overhead offline (default: openai)",
+    )
+    cache = parser.add_mutually_exclusive_group()
+    cache.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Neither read nor write the review cache",
+    )
+    cache.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore cached reviews but store the new ones",
+    )
+    args = parser.parse_args()
+    if args.batch == "collect":
+        if any((args.file, args.path, args.diff, args.watch, args.serve)):
+            parser.error("--batch collect takes the files from --batch-state")
+    elif args.batch == "submit":
+        if not (args.file or args.path):
+            parser.error("--batch submit requires --file or --path")
+        if args.serve or args.stream or args.pack:
+            parser.error(
+                "--batch submit cannot be combined with --serve, --stream or --pack"
+            )
+        if args.output:
+            parser.error(
+                "--output belongs to --batch collect, which writes the findings"
+            )
+    elif not any((args.file, args.path, args.diff, args.watch, args.serve)):
+        parser.error(
+            "one of the arguments --file --path --diff --watch --serve --batch is required"
+        )
+    if args.batch is not None and args.backend == "fake":
+        parser.error(
+            "--backend fake keeps batches in memory, so a later run cannot collect them"
+        )
+    if args.watch or args.serve:
+        if any((args.file, args.path, args.diff)):
+            parser.error("--serve cannot be combined with --file, --path or --diff")
+        # The daemon reviews one file at a time and only logs or returns reviews
+        unsupported = [
+            flag
+            for flag, value in (
+                ("--output", args.output),
+                ("--triage", args.triage),
+                ("--dedup", args.dedup),
+                ("--pack", args.pack),
+            )
+            if value
+        ]
+        if unsupported:
+            parser.error(
+                f"--watch and --serve cannot be combined with {', '.join(unsupported)}"
+            )
+    if args.batch_wait is not None and args.batch_wait <= 0:
+        parser.error("--batch-wait must be positive")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.context < 0:
+        parser.error("--context must not be negative")
+    if not 0 < args.dedup_threshold <= 1:
+        parser.error("--dedup-threshold must be greater than 0 and at most 1")
+    if args.pack_tokens < 1:
+        parser.error("--pack-tokens must be at least 1")
+    if args.token_budget is not None and args.token_budget < 1:
+        parser.error("--token-budget must be at least 1")
+    if args.analysis_workers is not None and args.analysis_workers < 1:
+        parser.error("--analysis-workers must be at least 1")
+    return args
 
 
 def get_file_path(args):
-    resolved_file_path = Path(args.file).resolve(strict=True)
+    resolved_file_path = Path(args.file or args.path or args.watch or ".").resolve(
+        strict=True
+    )
     # logging.info(f"Found file '{resolved_file_path}'")
     return resolved_file_path
 
 
-def create_client(api_key):
-    return OpenAI(api_key=api_key)  # We omit the parameter if it's the default
+def create_client(api_key, max_connections=DEFAULT_CONCURRENCY):
+    from openai import AsyncOpenAI
+
+    from request_layer import create_http_client
+
+    # Retries are handled by the request layer, which also honors rate limits
+    return AsyncOpenAI(
+        api_key=api_key,
+        http_client=create_http_client(max_connections),
+        max_retries=0,
+    )
+
+
+def create_request_layer(config):
+    """Returns the request layer with the rate limits and retries configured in .env."""
+    from request_layer import DEFAULT_MAX_RETRIES, RequestLayer, RetryPolicy
+
+    requests_per_minute = config.get("REQUESTS_PER_MINUTE")
+    tokens_per_minute = config.get("TOKENS_PER_MINUTE")
+    return RequestLayer(
+        requests_per_minute=int(requests_per_minute) if requests_per_minute else None,
+        tokens_per_minute=int(tokens_per_minute) if tokens_per_minute else None,
+        retry_policy=RetryPolicy(
+            max_retries=int(config.get("MAX_RETRIES", DEFAULT_MAX_RETRIES))
+        ),
+    )
+
+
+def create_chunk_settings(model, config):
+    """Returns the model's chunk settings with any overrides from .env applied."""
+    settings = settings_for_model(model)
+    return ChunkSettings(
+        max_tokens=int(config.get("CHUNK_TOKENS", settings.max_tokens)),
+        overlap_lines=int(config.get("CHUNK_OVERLAP", settings.overlap_lines)),
+    )
+
+
+def create_cache(args, config):
+    """Opens the review cache configured in .env, or returns None with --no-cache."""
+    if args.no_cache:
+        return None
+    return ReviewCache(
+        config.get("CACHE_FILE", "review_cache.sqlite3"),
+        max_bytes=int(config.get("CACHE_MAX_MB", 256)) * 1024 * 1024,
+        max_age_days=float(config.get("CACHE_MAX_AGE_DAYS", DEFAULT_MAX_AGE_DAYS)),
+        refresh=args.refresh,
+    )
+
+
+def log_cache_stats(cache):
+    logger = logging.getLogger(__name__)
+    stats = cache.stats()
+    lookups = stats["hits"] + stats["misses"]
+    hit_rate = stats["hits"] / lookups if lookups else 0.0
+    logger.info(
+        f"Review cache: {stats['hits']} hits, {stats['misses']} misses "
+        f"({hit_rate:.0%} hit rate), {stats['stores']} stored, "
+        f"{stats['evictions']} evicted"
+    )
+
+
+def create_telemetry(args, config, root):
+    """Returns the telemetry of the run, with the prices overridden in .env if any."""
+    prompt_price = config.get("PROMPT_PRICE_PER_MTOK")
+    completion_price = config.get("COMPLETION_PRICE_PER_MTOK")
+    prices = None
+    if prompt_price or completion_price:
+        prices = (float(prompt_price or 0), float(completion_price or 0))
+    if args.diff is not None:
+        root = Path.cwd()
+    directory = root if root.is_dir() else root.parent
+    try:
+        repository = repository_root(directory).name
+    except (ValueError, OSError):
+        # Not a git repository, or git is not installed
+        repository = directory.name
+    return Telemetry(prices, {"repository": repository})
+
+
+def report_telemetry(args, telemetry):
+    """Logs the usage table of the run and writes the requested metrics files."""
+    logger = logging.getLogger(__name__)
+    if telemetry.languages:
+        logger.info("Usage:\n" + telemetry.table())
+    if telemetry.unpriced_models:
+        logger.warning(
+            f"No price known for {', '.join(sorted(telemetry.unpriced_models))}; "
+            "set PROMPT_PRICE_PER_MTOK and COMPLETION_PRICE_PER_MTOK in .env"
+        )
+    if args.metrics_json is not None:
+        telemetry.write_json(args.metrics_json)
+        logger.info(f"Wrote run metrics to '{args.metrics_json}'")
+    if args.metrics_prom is not None:
+        telemetry.write_prometheus(args.metrics_prom)
+        logger.info(f"Wrote Prometheus metrics to '{args.metrics_prom}'")
+
+
+def create_backend(args, api_key):
+    """Returns the backend selected with --backend."""
+    from backends import FakeBackend, OpenAIBackend
+
+    if args.backend == "fake":
+        return FakeBackend()
+    return OpenAIBackend(create_client(api_key, args.concurrency))
+
+
+def create_factory(args, api_key, model, config, cache, telemetry=None):
+    return ReviewerFactory(
+        create_backend(args, api_key),
+        None,
+        cache,
+        create_chunk_settings(model, config),
+        args.stream,
+        create_request_layer(config),
+        # Batch reviews are consumed offline, so their findings are always requested
+        structured=args.output is not None or args.batch == "submit",
+        telemetry=telemetry,
+    )
+
+
+def group_duplicates(args, file_paths):
+    """Returns the files to review and the DuplicateGroup of each representative."""
+    logger = logging.getLogger(__name__)
+    sources = {}
+    for file_path in file_paths:
+        try:
+            sources[file_path] = CodeReviewer.read_source(file_path)
+        except (OSError, UnicodeDecodeError):
+            # Unreadable files are left to the review to report
+            continue
+    groups = find_duplicates(sources, args.dedup_threshold, args.analysis_workers)
+    skipped = {member for group in groups for member in group.members()}
+    if groups:
+        logger.info(
+            f"Skipping {len(skipped)} duplicate files, whose {len(groups)} "
+            f"representatives are reviewed in their place"
+        )
+    duplicates = {group.representative: group for group in groups}
+    return [path for path in file_paths if path not in skipped], duplicates
+
+
+def triage_files(args, factory, file_paths, root, model):
+    """Drops trivial files and orders the others by risk, within --token-budget."""
+    logger = logging.getLogger(__name__)
+    start = time.perf_counter()
+    metrics = analyze_files(file_paths, args.analysis_workers, model)
+    churn = git_churn(root if root.is_dir() else root.parent)
+    for file_metrics in metrics:
+        file_metrics.churn = churn.get(file_metrics.path, 0)
+    # Every request also carries a system prompt and the review instructions
+    language_prompts = factory.language_prompts or default_language_prompts()
+    overhead_tokens = count_tokens(REVIEW_INSTRUCTIONS, model) + max(
+        count_tokens(prompt["content"], model) for prompt in language_prompts.values()
+    )
+    selected, trivial, over_budget = prioritize(
+        metrics,
+        args.min_lines,
+        args.min_complexity,
+        args.token_budget,
+        overhead_tokens,
+    )
+    logger.info(
+        f"Analyzed {len(metrics)} files in {time.perf_counter() - start:.1f}s: "
+        f"skipping {len(trivial)} trivial and {len(over_budget)} over the token "
+        f"budget, reviewing {len(selected)} riskiest first"
+    )
+    return [file_metrics.path for file_metrics in selected]
+
+
+def run_batch(args, factory, model, root, writer=None):
+    logger = logging.getLogger(__name__)
+    file_paths = collect_files(root, args.glob, factory.supported_extensions())
+    if not file_paths:
+        raise ValueError(f"No supported files found in '{root}' matching '{args.glob}'")
+    if args.triage:
+        file_paths = triage_files(args, factory, file_paths, root, model)
+    total = len(file_paths)
+    duplicates = None
+    if args.dedup:
+        file_paths, duplicates = group_duplicates(args, file_paths)
+    logger.info(
+        f"Reviewing {len(file_paths)} files with concurrency {args.concurrency}"
+    )
+    start = time.perf_counter()
+    failures = asyncio.run(
+        run_and_close(
+            factory,
+            review_files(
+                factory,
+                file_paths,
+                model,
+                args.concurrency,
+                writer=writer,
+                duplicates=duplicates,
+                pack_tokens=args.pack_tokens if args.pack else None,
+            ),
+        )
+    )
+    logger.info(
+        f"Reviewed {total - failures}/{total} files "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+    return failures
+
+
+def run_batch_submit(args, factory, model, root):
+    logger = logging.getLogger(__name__)
+    file_paths = collect_files(root, args.glob, factory.supported_extensions())
+    if not file_paths:
+        raise ValueError(f"No supported files found in '{root}' matching '{args.glob}'")
+    if args.triage:
+        file_paths = triage_files(args, factory, file_paths, root, model)
+    asyncio.run(
+        run_and_close(
+            factory,
+            submit_batch(factory, file_paths, model, args.batch_state, logger),
+        )
+    )
+    return 0
+
+
+def run_batch_collect(args, factory, writer=None):
+    """Logs the reviews of the submitted batch job, and writes their findings to writer."""
+    logger = logging.getLogger(__name__)
+    job, reviews = asyncio.run(
+        run_and_close(
+            factory,
+            collect_batch(factory, args.batch_state, logger, args.batch_wait),
+        )
+    )
+    if reviews is None:
+        logger.info("Run --batch collect again later, or add --batch-wait")
+        return 0
+    failures = 0
+    for file_path, review_content in reviews.items():
+        if review_content is None:
+            logger.error(f"Review of '{file_path}' failed in batch '{job.batch_id}'")
+            failures += 1
+            continue
+        review_content, findings = split_findings(
+            review_content, display_path(file_path)
+        )
+        if writer is not None:
+            writer.write(findings)
+        logger.info(f"Review of '{file_path}'")
+        factory.get_reviewer(file_path.suffix.lower()).log_review(review_content)
+    logger.info(f"Collected {len(reviews) - failures}/{len(reviews)} reviews")
+    return failures
+
+
+def collect_excerpts(args, extensions, repo_root):
+    """Returns the changed files of --diff and the excerpts to review for each of them."""
+    base, head = parse_revision_range(args.diff, repo_root)
+    excerpts = {}
+    for change in changed_files(repo_root, base, head):
+        if change.path.suffix.lower() not in extensions:
+            continue
+        source = read_revision(repo_root, head, change.path)
+        total_lines = len(source.splitlines())
+        line_ranges = expand_ranges(change.hunks, args.context, total_lines)
+        if line_ranges:
+            excerpts[change.path] = (source, line_ranges)
+    return excerpts
+
+
+def run_diff(args, factory, model, writer=None):
+    logger = logging.getLogger(__name__)
+    repo_root = repository_root(Path.cwd())
+    excerpts = collect_excerpts(args, factory.supported_extensions(), repo_root)
+    if not excerpts:
+        logger.info(f"No supported files changed in '{args.diff}'")
+        return 0
+    file_paths = sorted(excerpts)
+    logger.info(f"Reviewing changes to {len(file_paths)} files in '{args.diff}'")
+    return asyncio.run(
+        run_and_close(
+            factory,
+            review_files(
+                factory, file_paths, model, args.concurrency, excerpts, writer
+            ),
+        )
+    )
+
+
+async def run_daemon(args, factory, model, root):
+    """Watches root and/or serves the review socket until interrupted."""
+    logger = logging.getLogger(__name__)
+    extensions = factory.supported_extensions()
+    daemon = ReviewDaemon(factory, model, args.concurrency, extensions, logger)
+    services = []
+    if args.watch is not None:
+        watcher = PollingWatcher(
+            root,
+            lambda directory: collect_files(directory, args.glob, extensions),
+            args.debounce,
+        )
+        services.append(daemon.watch(watcher))
+    if args.serve is not None:
+        services.append(daemon.serve(args.serve))
+    # Shut down cleanly when a service manager stops the daemon
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGTERM, asyncio.current_task().cancel
+    )
+    try:
+        await asyncio.gather(*services)
+    except asyncio.CancelledError:
+        logger.info("Stopped")
+    finally:
+        await factory.close()
 
 
 def main():
     """Entry point of the application"""
     args = parse_arguments()
     try:
-        OPENAI_API_KEY, OPENAI_MODEL, LOG_FILE = initialize_configuration()
+        OPENAI_API_KEY, OPENAI_MODEL, LOG_FILE, config = initialize_configuration(
+            require_api_key=args.backend == "openai"
+        )
         logger = logging.getLogger(__name__)
         resolved_file_path = get_file_path(args)
 
-        if resolved_file_path.exists():
-            logger.info(f"Found file '{resolved_file_path}'")
-
-            ext = resolved_file_path.suffix.lower()
-            client = create_client(OPENAI_API_KEY)
-            factory = ReviewerFactory(client, LANGUAGE_PROMPTS)
-            language_reviewer = factory.get_reviewer(ext)
-            language_reviewer.review_file(resolved_file_path, OPENAI_MODEL)
-        else:
+        if args.file is not None and not resolved_file_path.is_file():
             raise FileNotFoundError(
                 f"The file '{resolved_file_path}' was not found. Please check the path and try again."
             )
+        if args.file is not None:
+            if resolved_file_path.suffix.lower() not in REVIEWER_CLASSES:
+                raise ValueError(f"Unsupported file type: {resolved_file_path.suffix}")
+            logger.info(f"Found file '{resolved_file_path}'")
+
+        cache = create_cache(args, config)
+        telemetry = create_telemetry(args, config, resolved_file_path)
+        factory = create_factory(
+            args, OPENAI_API_KEY, OPENAI_MODEL, config, cache, telemetry
+        )
+
+        if args.watch is not None or args.serve is not None:
+            try:
+                asyncio.run(run_daemon(args, factory, OPENAI_MODEL, resolved_file_path))
+            except KeyboardInterrupt:
+                logger.info("Stopped")
+            report_telemetry(args, telemetry)
+            return
+
+        with contextlib.ExitStack() as stack:
+            writer = None
+            if args.output is not None:
+                writer = stack.enter_context(
+                    create_writer(args.output, args.output_format)
+                )
+            if args.batch == "submit":
+                failures = run_batch_submit(
+                    args, factory, OPENAI_MODEL, resolved_file_path
+                )
+            elif args.batch == "collect":
+                failures = run_batch_collect(args, factory, writer)
+            elif args.diff is not None:
+                failures = run_diff(args, factory, OPENAI_MODEL, writer)
+            else:
+                failures = run_batch(
+                    args, factory, OPENAI_MODEL, resolved_file_path, writer
+                )
+        if cache:
+            log_cache_stats(cache)
+        report_telemetry(args, telemetry)
+        if failures:
+            sys.exit(1)
     except FileNotFoundError as not_found_err:
         logger.error(f"File not found error: {not_found_err}")
         sys.exit(1)
@@ -0,0 +1,202 @@
+"""
+This module finds identical and near-identical source files so that each is reviewed only once.
+
+Files are first grouped by a hash of their normalized source. The remaining
+distinct sources are compared by one-permutation MinHash signatures of their
+token shingles, bucketed with locality-sensitive hashing so that each file is
+only compared with likely representatives of earlier groups. Signatures of many files are computed on a process pool.
+Line numbers of a review can be carried over to a near-duplicate with a line
+diff between the two sources.
+
+Classes:
+    DuplicateGroup
+
+Functions:
+    tokenize
+    minhash_signature
+    signatures_of
+    find_duplicates
+    map_lines
+"""
+
+import difflib
+import hashlib
+import os
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from review_cache import normalize_source
+
+DEFAULT_THRESHOLD = 0.9
+SHINGLE_SIZE = 5
+BANDS = 16
+ROWS_PER_BAND = 4
+NUM_PERMUTATIONS = BANDS * ROWS_PER_BAND
+# Added per bin of distance to values borrowed from another bin, see minhash_signature
+BORROWED_OFFSET = 1 << 58
+TOKEN = re.compile(r"\w+|[^\w\s]")
+# Below this many files, starting a process pool takes longer than hashing
+PARALLEL_THRESHOLD = 64
+
+
+@dataclass
+class DuplicateGroup:
+    """A file that gets reviewed and the files that reuse its review.
+
+    `copies` are paths whose normalized source is identical to the representative's,
+    `near_duplicates` are (path, estimated similarity) pairs.
+    """
+
+    representative: object
+    copies: list = field(default_factory=list)
+    near_duplicates: list = field(default_factory=list)
+
+    def members(self):
+        return self.copies + [path for path, _ in self.near_duplicates]
+
+
+def _digest(source):
+    return hashlib.sha256(normalize_source(source).encode()).hexdigest()
+
+
+def tokenize(source):
+    return TOKEN.findall(normalize_source(source))
+
+
+def minhash_signature(tokens):
+    """Returns the one-permutation MinHash signature of the shingles of tokens.
+
+    Every shingle is hashed once. The hash picks one of NUM_PERMUTATIONS bins,
+    and each bin keeps the smallest hash it got. A bin that got none borrows
+    the value of the next bin that did, offset by their distance.
+    """
+    shingles = {
+        " ".join(tokens[i : i + SHINGLE_SIZE])
+        for i in range(max(1, len(tokens) - SHINGLE_SIZE + 1))
+    }
+    hashes = sorted(
+        (
+            int.from_bytes(
+                hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big"
+            )
+            for shingle in shingles
+        ),
+        reverse=True,
+    )
+    bins = [None] * NUM_PERMUTATIONS
+    # Smaller hashes come last and overwrite larger ones
+    for value in hashes:
+        bins[value % NUM_PERMUTATIONS] = value // NUM_PERMUTATIONS
+    signature = []
+    for index in range(NUM_PERMUTATIONS):
+        distance = 0
+        while bins[(index + distance) % NUM_PERMUTATIONS] is None:
+            distance += 1
+        value = bins[(index + distance) % NUM_PERMUTATIONS]
+        signature.append(value + distance * BORROWED_OFFSET)
+    return tuple(signature)
+
+
+def source_signature(source):
+    return minhash_signature(tokenize(source))
+
+
+def signatures_of(sources, workers=None):
+    """Returns the signature of every source, computed on `workers` processes.
+
+    `workers` defaults to the number of CPUs.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(sources) < PARALLEL_THRESHOLD:
+        return [source_signature(source) for source in sources]
+    # Imported here, as multiprocessing would slow down the startup of every run
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(
+            pool.map(
+                source_signature,
+                sources,
+                chunksize=max(1, len(sources) // (workers * 4)),
+            )
+        )
+
+
+def similarity(signature, other):
+    """Estimates the Jaccard similarity of two shingle sets from their signatures."""
+    return sum(x == y for x, y in zip(signature, other)) / NUM_PERMUTATIONS
+
+
+def find_duplicates(sources, threshold=DEFAULT_THRESHOLD, workers=None):
+    """Groups the files of sources, a dict of path to source text, by similarity.
+
+    Only files with the same extension are grouped, since they are reviewed with
+    the same prompt, and signatures are computed on `workers` processes.
+    Returns a DuplicateGroup for every cluster with at least two files; its
+    representative is the first path of the cluster in sorted order.
+    """
+    by_content = defaultdict(list)
+    for path in sorted(sources):
+        by_content[(path.suffix.lower(), _digest(sources[path]))].append(path)
+    # In sorted order, so the smallest index of a cluster is its representative
+    distinct = [paths[0] for paths in by_content.values()]
+
+    signatures = signatures_of([sources[path] for path in distinct], workers)
+    # Leader clustering: in sorted order, every file joins the most similar
+    # representative found so far, or becomes one. Comparing with the
+    # representative, not with any member, keeps chains of small edits apart.
+    buckets = defaultdict(list)
+    clusters = {}
+    for index, path in enumerate(distinct):
+        signature = signatures[index]
+        keys = [
+            (
+                path.suffix.lower(),
+                band,
+                signature[band * ROWS_PER_BAND : (band + 1) * ROWS_PER_BAND],
+            )
+            for band in range(BANDS)
+        ]
+        candidates = {leader for key in keys for leader in buckets[key]}
+        scores = [
+            (similarity(signature, signatures[leader]), -leader)
+            for leader in candidates
+        ]
+        best = max(scores, default=None)
+        if best is not None and best[0] >= threshold:
+            clusters[distinct[-best[1]]].append((path, best[0]))
+            continue
+        clusters[path] = []
+        for key in keys:
+            buckets[key].append(index)
+
+    groups = []
+    for root in sorted(clusters):
+        group = DuplicateGroup(representative=root)
+        group.copies.extend(
+            by_content[(root.suffix.lower(), _digest(sources[root]))][1:]
+        )
+        for path, score in clusters[root]:
+            # A near-duplicate and all exact copies of it
+            copies = by_content[(path.suffix.lower(), _digest(sources[path]))]
+            group.near_duplicates.extend((copy, score) for copy in copies)
+        if group.copies or group.near_duplicates:
+            group.near_duplicates.sort()
+            groups.append(group)
+    return groups
+
+
+def map_lines(source, other):
+    """Maps the line numbers of source to those of the same lines in other.
+
+    Only lines within blocks that a line diff finds in both sources are mapped.
+    """
+    lines = normalize_source(source).split("\n")
+    other_lines = normalize_source(other).split("\n")
+    matcher = difflib.SequenceMatcher(None, lines, other_lines, autojunk=False)
+    mapping = {}
+    for start, other_start, size in matcher.get_matching_blocks():
+        for offset in range(size):
+            mapping[start + offset + 1] = other_start + offset + 1
+    return mapping
@@ -0,0 +1,161 @@
+"""
+This module provides the git plumbing for reviewing only the changes between two revisions.
+
+Classes:
+    FileChange
+
+Functions:
+    parse_revision_range
+    unquote_path
+    repository_root
+    changed_files
+    expand_ranges
+    number_excerpt
+"""
+
+import re
+import subprocess
+from dataclasses import dataclass, field
+from pathlib import Path
+
+HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+DEFAULT_CONTEXT_LINES = 10
+# The C escapes git uses in quoted file names, besides octal bytes
+ESCAPES = {
+    b"a": b"\a",
+    b"b": b"\b",
+    b"f": b"\f",
+    b"n": b"\n",
+    b"r": b"\r",
+    b"t": b"\t",
+    b"v": b"\v",
+}
+
+
+@dataclass
+class FileChange:
+    """The changed lines of one file, as 1-based inclusive ranges in the new revision."""
+
+    path: Path
+    hunks: list = field(default_factory=list)
+
+
+def run_git(args, cwd):
+    # Print non-ASCII file names as they are instead of quoting them
+    result = subprocess.run(
+        ["git", "-c", "core.quotePath=false", *args],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if result.returncode != 0:
+        raise ValueError(f"git {' '.join(args)} failed: {result.stderr.strip()}")
+    return result.stdout
+
+
+def parse_revision_range(spec, repo_root=None):
+    """Splits '<base>..<head>' into (base, head); an empty head means the working tree.
+
+    As in git diff, base in '<base>...<head>' is the merge base of both, which
+    is looked up in the repository at repo_root.
+    """
+    base, separator, head = spec.partition("..")
+    if not separator or not base:
+        raise ValueError(f"Expected a revision range like 'main..HEAD', got '{spec}'")
+    if head.startswith("."):
+        head = head[1:]
+        base = run_git(["merge-base", base, head or "HEAD"], repo_root).strip()
+    return base, head or None
+
+
+def unquote_path(path):
+    """Undoes the quoting git applies to file names with special characters."""
+    if not (path.startswith('"') and path.endswith('"')):
+        return path
+
+    def unescape(match):
+        escape = match.group(1)
+        if escape.isdigit():
+            return bytes([int(escape, 8)])
+        return ESCAPES.get(escape, escape)
+
+    return re.sub(rb"\\([0-7]{3}|.)", unescape, path[1:-1].encode()).decode()
+
+
+def repository_root(path):
+    return Path(run_git(["rev-parse", "--show-toplevel"], path).strip())
+
+
+def changed_files(repo_root, base, head):
+    """Returns a FileChange for every added, modified or renamed file between base and head."""
+    revisions = [base, head] if head else [base]
+    diff = run_git(
+        ["diff", "--unified=0", "--no-color", "--no-ext-diff", "--diff-filter=AMR"]
+        + revisions
+        + ["--"],
+        repo_root,
+    )
+    changes = []
+    for line in diff.splitlines():
+        if line.startswith("+++ "):
+            # git ends names that contain spaces with a tab
+            target = unquote_path(line[4:].rstrip("\t"))
+            if target == "/dev/null":
+                continue
+            # Strip the "b/" prefix git puts on the new side of a diff
+            changes.append(FileChange(repo_root / target[2:]))
+        elif line.startswith("@@") and changes:
+            match = HUNK_HEADER.match(line)
+            if match is None:
+                continue
+            start = int(match.group(1))
+            count = 1 if match.group(2) is None else int(match.group(2))
+            if count == 0:
+                # Pure deletion: keep the line the removed code was next to
+                changes[-1].hunks.append((max(start, 1), max(start, 1)))
+            else:
+                changes[-1].hunks.append((start, start + count - 1))
+    return [change for change in changes if change.hunks]
+
+
+def read_revision(repo_root, head, path):
+    """Returns the content of path at head, or from the working tree if head is None."""
+    if head is None:
+        with open(path, "r") as file:
+            return file.read()
+    relative = path.relative_to(repo_root).as_posix()
+    return run_git(["show", f"{head}:{relative}"], repo_root)
+
+
+def expand_ranges(hunks, context, total_lines):
+    """Widens every hunk by `context` lines on each side and merges overlapping ranges."""
+    merged = []
+    for start, end in sorted(hunks):
+        start = max(1, start - context)
+        end = min(total_lines, end + context)
+        if start > end:
+            continue
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def number_excerpt(source, line_ranges):
+    """Numbers the lines of source like a full review, keeping only line_ranges.
+
+    Omitted lines are replaced by a single '...' so that the original line numbers
+    stay valid for every shown line.
+    """
+    lines = source.splitlines()
+    blocks = []
+    for start, end in line_ranges:
+        blocks.append("\n".join(f"{i}: {lines[i - 1]}" for i in range(start, end + 1)))
+    excerpt = "\n...\n".join(blocks)
+    if line_ranges and line_ranges[0][0] > 1:
+        excerpt = "...\n" + excerpt
+    if line_ranges and line_ranges[-1][1] < len(lines):
+        excerpt += "\n..."
+    return excerpt
@@ -0,0 +1,108 @@
+"""
+This module packs several small files of one language into a single review request.
+
+For small files, the fixed system prompt and review instructions outweigh the
+code itself. Packing sends them once for a whole group of files, with a marker
+line before every file, and asks for the review of each file to start with a
+matching marker so that the answer can be split back into per-file reviews.
+
+Classes:
+    Pack
+    PackingStats
+
+Functions:
+    plan_packs
+    pack_code
+    split_pack_review
+"""
+
+import re
+from dataclasses import dataclass, field
+
+DEFAULT_PACK_TOKENS = 8000
+# Files above this many tokens are always reviewed on their own
+SMALL_FILE_TOKENS = 1500
+MAX_FILES_PER_PACK = 10
+
+PACK_INTRODUCTION = (
+    "I have the following {count} files. Each file starts with a line "
+    "'===== FILE <number>: <path> ====='. Review every file separately and start "
+    "the review of each file with a line '===== REVIEW <number> =====' containing "
+    "its number"
+)
+REVIEW_MARKER = re.compile(r"^=+\s*REVIEW\s+(\d+)\s*=+\s*$", re.MULTILINE)
+
+
+@dataclass
+class Pack:
+    """Files of one extension reviewed in a single request."""
+
+    extension: str
+    file_paths: list = field(default_factory=list)
+    tokens: int = 0
+
+
+@dataclass
+class PackingStats:
+    """Prompt tokens of packed requests, compared with sending each file on its own."""
+
+    single_tokens: int = 0
+    packed_tokens: int = 0
+    files: int = 0
+    requests: int = 0
+
+    @property
+    def saved_ratio(self):
+        if not self.single_tokens:
+            return 0.0
+        return 1 - self.packed_tokens / self.single_tokens
+
+
+def plan_packs(file_tokens, max_tokens=DEFAULT_PACK_TOKENS):
+    """Groups small files of the same extension into packs of at most max_tokens tokens.
+
+    `file_tokens` is a list of (path, tokens) pairs. Returns the packs with at
+    least two files; files that are large or left alone are not part of any pack.
+    """
+    open_packs = {}
+    packs = []
+    for file_path, tokens in file_tokens:
+        if tokens > min(SMALL_FILE_TOKENS, max_tokens):
+            continue
+        extension = file_path.suffix.lower()
+        pack = open_packs.get(extension)
+        if (
+            pack is None
+            or pack.tokens + tokens > max_tokens
+            or len(pack.file_paths) >= MAX_FILES_PER_PACK
+        ):
+            pack = Pack(extension)
+            open_packs[extension] = pack
+            packs.append(pack)
+        pack.file_paths.append(file_path)
+        pack.tokens += tokens
+    return [pack for pack in packs if len(pack.file_paths) > 1]
+
+
+def pack_code(tag, files):
+    """Renders (name, numbered code) pairs as one code block per file, each after its marker."""
+    return "\n\n".join(
+        f"===== FILE {number}: {name} =====\n```{tag}\n{code_content}\n```"
+        for number, (name, code_content) in enumerate(files, start=1)
+    )
+
+
+def split_pack_review(review, count):
+    """Splits the review of a pack into the reviews of its files, by their markers.
+
+    Returns a list of count reviews in file order, with None for every file whose
+    review could not be found.
+    """
+    reviews = [None] * count
+    markers = list(REVIEW_MARKER.finditer(review))
+    for marker, following in zip(markers, markers[1:] + [None]):
+        number = int(marker.group(1))
+        section = review[marker.end() : following.start() if following else None]
+        if 1 <= number <= count and section.strip():
+            reviews[number - 1] = section.strip()
+    return reviews
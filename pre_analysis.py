@@ -0,0 +1,259 @@
+"""
+This module analyzes source files locally to decide which ones are worth a review.
+
+Python files are parsed with ast; TypeScript, Kotlin and C++ files are scanned
+with a lexer that blanks out comments and string literals. For every file, the
+number of code lines (neither blank, comments nor docstrings), an estimate of its
+tokens and its cyclomatic complexity are computed, and files that only import or
+re-export other modules are recognized as stubs. Together with how often git
+history shows a file changing (its churn), this gives a risk score, so that the
+riskiest files are reviewed first and trivial ones are not sent at all.
+
+Analysis runs on a process pool, as parsing is CPU-bound.
+
+Classes:
+    FileMetrics
+
+Functions:
+    analyze_file
+    analyze_files
+    git_churn
+    prioritize
+"""
+
+import ast
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+
+from chunking import BRACE_NOISE, count_tokens
+from git_diff import repository_root, run_git
+
+DEFAULT_MIN_LINES = 3
+DEFAULT_CHURN_SINCE = "1 year ago"
+# Below this many files, starting a process pool takes longer than the analysis
+PARALLEL_THRESHOLD = 64
+
+DECISION_NODES = (
+    ast.If,
+    ast.For,
+    ast.AsyncFor,
+    ast.While,
+    ast.IfExp,
+    ast.ExceptHandler,
+    ast.match_case,
+)
+BRANCH_PATTERNS = {
+    # Optional properties (x?: T) and chaining (x?.y) are not branches
+    ".ts": re.compile(r"\b(?:if|for|while|case|catch)\b|&&|\|\||\?\?|\?(?![.:?])"),
+    ".kt": re.compile(r"\b(?:if|for|while|when|catch)\b|&&|\|\||\?:"),
+    ".cpp": re.compile(r"\b(?:if|for|while|case|catch)\b|&&|\|\||\?"),
+}
+# Statements that only declare, import or re-export other modules
+STUB_STATEMENTS = {
+    ".ts": re.compile(
+        r"\b(?:import|export)\b[^;{}]*(?:\{[^}]*\}[^;{}]*)?\bfrom\b\s*;?"
+        r"|\bimport\b\s*;?|\bexport\s*\{[^}]*\}\s*;?"
+    ),
+    ".kt": re.compile(r"^\s*(?:package|import)\b.*$", re.MULTILINE),
+    ".cpp": re.compile(
+        r"^\s*#\s*(?:include|pragma|ifndef|ifdef|define|endif)\b.*$", re.MULTILINE
+    ),
+}
+
+
+@dataclass
+class FileMetrics:
+    path: object
+    code_lines: int = 0
+    tokens: int = 0
+    complexity: int = 1
+    # Whether the file only imports or re-exports other modules
+    stub: bool = False
+    # Commits that changed the file recently, see git_churn
+    churn: int = 0
+    # Set if the file could not be read; it is then left to the review to report
+    error: str | None = None
+
+    @property
+    def risk(self):
+        # Complexity weighs most; size and recent changes raise the odds of a defect
+        return (self.complexity + self.code_lines / 50) * (1 + math.log1p(self.churn))
+
+
+def _python_decisions(node):
+    if isinstance(node, DECISION_NODES):
+        return 1
+    if isinstance(node, ast.BoolOp):
+        return len(node.values) - 1
+    if isinstance(node, ast.comprehension):
+        return 1 + len(node.ifs)
+    return 0
+
+
+def _is_docstring(node):
+    return (
+        isinstance(node, ast.Expr)
+        and isinstance(node.value, ast.Constant)
+        and isinstance(node.value.value, str)
+    )
+
+
+def _is_python_stub_statement(node):
+    if isinstance(node, (ast.Import, ast.ImportFrom)) or _is_docstring(node):
+        return True
+    # __all__ = [...] lists the re-exported names
+    return isinstance(node, ast.Assign) and all(
+        isinstance(target, ast.Name) and target.id == "__all__"
+        for target in node.targets
+    )
+
+
+def _python_metrics(metrics, source):
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        # Leave the error to the review, and fall back to the lexer
+        return _lexer_metrics(metrics, source, ".py")
+    docstring_lines = set()
+    decisions = 0
+    for node in ast.walk(tree):
+        decisions += _python_decisions(node)
+        if (
+            isinstance(
+                node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)
+            )
+            and node.body
+            and _is_docstring(node.body[0])
+        ):
+            docstring = node.body[0]
+            docstring_lines.update(range(docstring.lineno, docstring.end_lineno + 1))
+    metrics.code_lines = sum(
+        1
+        for number, line in enumerate(source.splitlines(), start=1)
+        if line.strip()
+        and not line.lstrip().startswith("#")
+        and number not in docstring_lines
+    )
+    metrics.complexity = 1 + decisions
+    metrics.stub = all(_is_python_stub_statement(node) for node in tree.body)
+    return metrics
+
+
+def _lexer_metrics(metrics, source, extension):
+    if extension == ".py":
+        code = re.sub(r"#[^\n]*", "", source)
+    else:
+        # Blank out comments and string literals but keep their newlines
+        code = BRACE_NOISE.sub(
+            lambda match: re.sub(r"[^\n]", " ", match.group()), source
+        )
+    metrics.code_lines = sum(1 for line in code.splitlines() if line.strip())
+    branches = BRANCH_PATTERNS.get(extension)
+    metrics.complexity = 1 + (len(branches.findall(code)) if branches else 0)
+    stub_statements = STUB_STATEMENTS.get(extension)
+    metrics.stub = bool(stub_statements) and not stub_statements.sub("", code).strip()
+    return metrics
+
+
+def analyze_file(file_path, model=None):
+    """Returns the FileMetrics of file_path, without its churn."""
+    metrics = FileMetrics(file_path)
+    try:
+        with open(file_path, "r") as file:
+            source = file.read()
+    except (OSError, UnicodeDecodeError) as error:
+        metrics.error = str(error)
+        return metrics
+    metrics.tokens = count_tokens(source, model)
+    extension = file_path.suffix.lower()
+    if extension == ".py":
+        return _python_metrics(metrics, source)
+    return _lexer_metrics(metrics, source, extension)
+
+
+def analyze_files(file_paths, workers=None, model=None):
+    """Returns the FileMetrics of every file, in order, analyzed on `workers` processes.
+
+    `workers` defaults to the number of CPUs.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(file_paths) < PARALLEL_THRESHOLD:
+        return [analyze_file(file_path, model) for file_path in file_paths]
+    # Imported here, as multiprocessing would slow down the startup of every run
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(
+            pool.map(
+                analyze_file,
+                file_paths,
+                [model] * len(file_paths),
+                chunksize=max(1, len(file_paths) // (workers * 4)),
+            )
+        )
+
+
+def git_churn(path, since=DEFAULT_CHURN_SINCE):
+    """Returns how many commits since `since` changed each file below path.
+
+    Files are keyed by absolute path. Outside a git repository, the result is empty.
+    """
+    try:
+        repo_root = repository_root(path)
+        log = run_git(
+            ["log", f"--since={since}", "--format=", "--name-only", "--no-renames"]
+            + ["--", "."],
+            path,
+        )
+    except ValueError:
+        return {}
+    # git log lists paths relative to the repository root
+    return Counter(repo_root / line for line in log.splitlines() if line.strip())
+
+
+def prioritize(
+    metrics,
+    min_lines=DEFAULT_MIN_LINES,
+    min_complexity=1,
+    token_budget=None,
+    overhead_tokens=0,
+):
+    """Splits metrics into the files to review, the trivial ones and those over budget.
+
+    Files are trivial if they are stubs or below min_lines code lines or
+    min_complexity. The others are ordered by descending risk, and with a
+    token_budget, a file is only kept while its tokens plus overhead_tokens (for
+    the prompts sent along with it) fit into what is left of the budget. Files
+    that could not be read are kept, last, so that their review reports the error.
+    Returns three lists of FileMetrics.
+    """
+    candidates, trivial, unreadable = [], [], []
+    for file_metrics in metrics:
+        if file_metrics.error is not None:
+            unreadable.append(file_metrics)
+        elif (
+            file_metrics.stub
+            or file_metrics.code_lines < min_lines
+            or file_metrics.complexity < min_complexity
+        ):
+            trivial.append(file_metrics)
+        else:
+            candidates.append(file_metrics)
+    candidates.sort(
+        key=lambda file_metrics: (-file_metrics.risk, str(file_metrics.path))
+    )
+
+    selected, over_budget = [], []
+    remaining = token_budget
+    for file_metrics in candidates:
+        tokens = file_metrics.tokens + overhead_tokens
+        if remaining is not None and tokens > remaining:
+            over_budget.append(file_metrics)
+            continue
+        selected.append(file_metrics)
+        if remaining is not None:
+            remaining -= tokens
+    return selected + unreadable, trivial, over_budget
@@ -0,0 +1,160 @@
+"""
+This module makes model requests resilient to rate limits and transient failures.
+
+All reviewers share one RequestLayer and one pooled HTTP client. Requests first
+wait for room in the requests-per-minute and tokens-per-minute buckets, so that a
+batch stays under the organization's quota instead of provoking 429s, and are
+retried with jittered exponential backoff (or after the server's Retry-After)
+when they fail anyway.
+
+Classes:
+    TokenBucket
+    RetryPolicy
+    RequestLayer
+
+Functions:
+    create_http_client
+    retry_after
+"""
+
+import asyncio
+import email.utils
+import random
+import time
+from dataclasses import dataclass
+
+import httpx
+import openai
+
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_TIMEOUT = 600.0
+# Reserved per request for the completion, whose length is unknown up front
+COMPLETION_TOKEN_ESTIMATE = 1000
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+def create_http_client(max_connections, timeout=DEFAULT_TIMEOUT):
+    """Returns an HTTP client whose connections are pooled and reused across requests."""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        ),
+        timeout=httpx.Timeout(timeout, connect=10.0),
+    )
+
+
+class TokenBucket:
+    """Async token bucket holding up to one minute's worth of `per_minute` units."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.available = float(per_minute)
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.available = min(
+            self.capacity, self.available + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    async def acquire(self, amount=1):
+        # A request larger than the bucket could never fit, so it waits for a full one
+        amount = min(amount, self.capacity)
+        # The lock makes waiters queue up in order instead of starving large requests
+        async with self.lock:
+            self.refill()
+            while self.available < amount:
+                await asyncio.sleep((amount - self.available) / self.rate)
+                self.refill()
+            self.available -= amount
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_retries: int = DEFAULT_MAX_RETRIES
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff for the given 0-based retry attempt."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+def retry_after(error):
+    """Returns the delay in seconds requested by the server's Retry-After header, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    milliseconds = response.headers.get("retry-after-ms")
+    if milliseconds is not None:
+        try:
+            return float(milliseconds) / 1000
+        except ValueError:
+            pass
+    value = response.headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def is_retryable(error):
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+
+class RequestLayer:
+    """Rate limits and retries the requests of all reviewers sharing it.
+
+    `requests_per_minute` and `tokens_per_minute` may be None for no limit.
+    """
+
+    def __init__(
+        self, requests_per_minute=None, tokens_per_minute=None, retry_policy=None
+    ):
+        self.requests = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.retries = 0
+
+    async def call(self, request, prompt_tokens=0, on_retry=None):
+        """Awaits request() within the rate limits, retrying transient failures.
+
+        `request` must create a new awaitable on every call. `on_retry` is called
+        with the error and the delay before each retry.
+        """
+        attempt = 0
+        while True:
+            if self.requests:
+                await self.requests.acquire()
+            if self.tokens:
+                await self.tokens.acquire(prompt_tokens + COMPLETION_TOKEN_ESTIMATE)
+            try:
+                return await request()
+            except openai.APIError as error:
+                if not is_retryable(error) or attempt >= self.retry_policy.max_retries:
+                    raise
+                delay = retry_after(error)
+                if delay is None:
+                    delay = self.retry_policy.backoff(attempt)
+                if on_retry:
+                    on_retry(error, delay)
+                self.retries += 1
+                attempt += 1
+                await asyncio.sleep(delay)
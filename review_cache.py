@@ -0,0 +1,196 @@
+"""
+This module provides a persistent, content-addressed cache for code reviews.
+
+A review is stored under a hash of everything that determines the model's answer:
+the normalized source, the system prompt, the user prompt template version, the
+model and the temperature. Re-reviewing an unchanged file is then a local lookup
+instead of a model call.
+
+Classes:
+    ReviewCache
+
+Functions:
+    normalize_source
+    make_key
+"""
+
+import hashlib
+import sqlite3
+import time
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_AGE_DAYS = 30
+# Stores are written in batches of this many, or after this many seconds
+COMMIT_EVERY = 100
+COMMIT_INTERVAL = 5.0
+
+
+def normalize_source(source):
+    """Normalizes line endings and trailing whitespace, which do not affect a review."""
+    lines = source.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).rstrip("\n")
+
+
+def make_key(source, system_prompt, template_version, model, temperature):
+    digest = hashlib.sha256()
+    for part in (
+        normalize_source(source),
+        system_prompt,
+        template_version,
+        model,
+        repr(temperature),
+    ):
+        encoded = part.encode("utf-8")
+        # Length-prefix every part so that no two different tuples hash alike
+        digest.update(len(encoded).to_bytes(8, "big"))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+class ReviewCache:
+    """SQLite-backed review store with size- and age-based LRU eviction.
+
+    `refresh` disables lookups while still storing new reviews, which overwrites
+    stale entries. Expired entries are dropped when the cache is opened. Stores
+    and the recency of lookups are kept in memory and written in one short
+    transaction by `flush` (or `close`), so that the database is never left
+    locked against other runs sharing it.
+    """
+
+    def __init__(
+        self,
+        path,
+        max_bytes=DEFAULT_MAX_BYTES,
+        max_age_days=DEFAULT_MAX_AGE_DAYS,
+        refresh=False,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 24 * 60 * 60
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS reviews ("
+            " key TEXT PRIMARY KEY,"
+            " review TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS reviews_accessed_at ON reviews (accessed_at)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS reviews_created_at ON reviews (created_at)"
+        )
+        # Key to the time of its last lookup, written to the database on flush
+        self.accessed = {}
+        # Key to the (review, size, time) of a store not written yet
+        self.pending = {}
+        self.committed_at = time.monotonic()
+        self.evict_expired()
+        (self.total_bytes,) = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM reviews"
+        ).fetchone()
+        self.connection.commit()
+
+    def get(self, key):
+        if self.refresh:
+            self.misses += 1
+            return None
+        if key in self.pending:
+            self.accessed[key] = time.time()
+            self.hits += 1
+            return self.pending[key][0]
+        row = self.connection.execute(
+            "SELECT review, created_at FROM reviews WHERE key = ?", (key,)
+        ).fetchone()
+        now = time.time()
+        if row is None or now - row[1] > self.max_age:
+            self.misses += 1
+            return None
+        self.accessed[key] = now
+        self.hits += 1
+        return row[0]
+
+    def put(self, key, review):
+        size = len(review.encode("utf-8"))
+        if key in self.pending:
+            replaced = self.pending[key][1]
+        else:
+            row = self.connection.execute(
+                "SELECT size FROM reviews WHERE key = ?", (key,)
+            ).fetchone()
+            replaced = row[0] if row else 0
+        self.pending[key] = (review, size, time.time())
+        self.accessed.pop(key, None)
+        self.total_bytes += size - replaced
+        self.stores += 1
+        # Eviction waits for the flush, so the database never exceeds max_bytes
+        if (
+            len(self.pending) >= COMMIT_EVERY
+            or time.monotonic() - self.committed_at >= COMMIT_INTERVAL
+        ):
+            self.flush()
+
+    def evict_expired(self, now=None):
+        """Drops the entries older than max_age."""
+        now = time.time() if now is None else now
+        cursor = self.connection.execute(
+            "DELETE FROM reviews WHERE created_at < ?", (now - self.max_age,)
+        )
+        self.evictions += cursor.rowcount
+
+    def evict(self):
+        """Drops least recently used entries until the cache is under max_bytes."""
+        stale_keys = []
+        for key, size in self.connection.execute(
+            "SELECT key, size FROM reviews ORDER BY accessed_at"
+        ):
+            if self.total_bytes <= self.max_bytes:
+                break
+            stale_keys.append((key,))
+            self.total_bytes -= size
+        self.connection.executemany("DELETE FROM reviews WHERE key = ?", stale_keys)
+        self.evictions += len(stale_keys)
+
+    def flush(self):
+        """Writes pending stores and the recency of lookups in one transaction.
+
+        Then evicts least recently used entries if the cache is over max_bytes.
+        """
+        self.committed_at = time.monotonic()
+        if not (self.pending or self.accessed):
+            return
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO reviews VALUES (?, ?, ?, ?, ?)",
+                [
+                    (key, review, size, stored_at, stored_at)
+                    for key, (review, size, stored_at) in self.pending.items()
+                ],
+            )
+            self.connection.executemany(
+                "UPDATE reviews SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self.accessed.items()],
+            )
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+        self.pending.clear()
+        self.accessed.clear()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        self.flush()
+        self.connection.close()
@@ -0,0 +1,61 @@
+"""
+This module submits files to a running review daemon (code_review.py --serve).
+
+It only uses the standard library so that it starts quickly, which matters when
+it runs from editors or pre-commit hooks for every change:
+
+    python review_client.py --socket /tmp/refactormind.sock src/app.py src/util.py
+
+Reviews are printed to stdout. The exit code is 1 if any review failed.
+
+Functions:
+    main
+    submit
+"""
+
+import argparse
+import json
+import socket
+import sys
+from pathlib import Path
+
+
+def submit(socket_path, file_paths):
+    """Yields the daemon's response for each of file_paths, in order."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        with connection.makefile("rwb") as stream:
+            for file_path in file_paths:
+                request = {"file": str(Path(file_path).resolve())}
+                stream.write(json.dumps(request).encode() + b"\n")
+                stream.flush()
+                yield json.loads(stream.readline())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Submit files to a running RefactorMind review daemon"
+    )
+    parser.add_argument("--socket", required=True, help="The daemon's Unix socket")
+    parser.add_argument("files", nargs="+", help="The files to review")
+    args = parser.parse_args()
+
+    failed = False
+    try:
+        for response in submit(args.socket, args.files):
+            if response.get("ok"):
+                print(f"# Review of {response['file']}\n\n{response['review']}\n")
+            else:
+                failed = True
+                print(
+                    f"Review of {response.get('file', '?')} failed: {response['error']}",
+                    file=sys.stderr,
+                )
+    except OSError as error:
+        print(f"Could not reach the review daemon: {error}", file=sys.stderr)
+        sys.exit(1)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
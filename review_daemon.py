@@ -0,0 +1,196 @@
+"""
+This module keeps RefactorMind running to review files as they change or are submitted.
+
+The daemon owns one warm ReviewerFactory (backend, connection pool, cache and
+request layer) for its whole lifetime. It can watch a directory by polling file
+modification times, reviewing a file once it has not changed for a debounce
+interval, and it can serve review requests on a Unix socket so that editors and
+pre-commit hooks do not pay the startup cost of a new process per file.
+
+The socket protocol is one JSON object per line. A request names a file,
+{"file": "/abs/path.py"}, and is answered with
+{"file": "/abs/path.py", "ok": true, "review": "..."}, or with "ok": false and an
+"error" message.
+
+Classes:
+    PollingWatcher
+    ReviewDaemon
+
+Functions:
+    file_signature
+"""
+
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_DEBOUNCE = 2.0
+
+
+def file_signature(path):
+    """Returns the modification time and size of path, or None if it cannot be read."""
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class PollingWatcher:
+    """Reports the files below root whose modification time or size changed.
+
+    A change is only reported once the file has been stable for `debounce`
+    seconds, so that a burst of saves results in a single review.
+    """
+
+    def __init__(self, root, list_files, debounce=DEFAULT_DEBOUNCE):
+        self.root = root
+        self.list_files = list_files
+        self.debounce = debounce
+        self.snapshot = self.scan()
+        # Path to the monotonic time of its last observed change
+        self.pending = {}
+
+    def scan(self):
+        snapshot = {}
+        for path in self.list_files(self.root):
+            signature = file_signature(path)
+            if signature is not None:
+                snapshot[path] = signature
+        return snapshot
+
+    def poll(self):
+        """Returns the files whose changes have settled since the last call."""
+        now = time.monotonic()
+        snapshot = self.scan()
+        for path, signature in snapshot.items():
+            if self.snapshot.get(path) != signature:
+                self.pending[path] = now
+        for path in set(self.pending) - set(snapshot):
+            # Deleted before it settled
+            del self.pending[path]
+        self.snapshot = snapshot
+        settled = sorted(
+            path
+            for path, changed_at in self.pending.items()
+            if now - changed_at >= self.debounce
+        )
+        for path in settled:
+            del self.pending[path]
+        return settled
+
+
+class ReviewDaemon:
+    """Reviews files with a warm factory, coalescing requests for the same content.
+
+    A request for a file whose review is running shares that review if the file
+    has not changed since it started. Otherwise one follow-up review is queued,
+    which all further requests share until it starts and reads the file.
+    """
+
+    def __init__(self, factory, model, concurrency, supported_extensions, logger):
+        self.factory = factory
+        self.logger = logger
+        self.model = model
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.supported_extensions = supported_extensions
+        # Path to the file_signature its running review started from, and its task
+        self.in_flight = {}
+        # Path to the task of the review queued to run after the running one
+        self.queued = {}
+
+    def review(self, file_path):
+        """Returns a task for the review of file_path's current content."""
+        running = self.in_flight.get(file_path)
+        if running is None:
+            task = asyncio.create_task(self._review(file_path))
+            self.in_flight[file_path] = (file_signature(file_path), task)
+        elif running[0] == file_signature(file_path):
+            return running[1]
+        elif file_path in self.queued:
+            return self.queued[file_path]
+        else:
+            task = asyncio.create_task(self._review(file_path, running[1]))
+            self.queued[file_path] = task
+        task.add_done_callback(lambda _: self._forget(file_path, task))
+        return task
+
+    def _forget(self, file_path, task):
+        if self.in_flight.get(file_path, (None, None))[1] is task:
+            del self.in_flight[file_path]
+
+    async def _review(self, file_path, previous=None):
+        if previous is not None:
+            # Wait for the review of the older content, whether it succeeds or not
+            await asyncio.wait([previous])
+            del self.queued[file_path]
+            self.in_flight[file_path] = (
+                file_signature(file_path),
+                asyncio.current_task(),
+            )
+        reviewer = self.factory.get_reviewer(file_path.suffix.lower())
+        review_content = await reviewer.review_file_async(
+            file_path, self.model, semaphore=self.semaphore, label=str(file_path)
+        )
+        if self.factory.cache:
+            # The daemon may stay idle for long, so let other runs see the review now
+            self.factory.cache.flush()
+        if review_content is not None and not self.factory.stream:
+            self.logger.info(f"Review of '{file_path}'")
+            reviewer.log_review(review_content)
+        return review_content
+
+    async def watch(self, watcher, interval=DEFAULT_POLL_INTERVAL):
+        self.logger.info(f"Watching '{watcher.root}' for changes")
+        while True:
+            await asyncio.sleep(interval)
+            # Scanning a large tree blocks, so keep it off the event loop
+            for file_path in await asyncio.to_thread(watcher.poll):
+                self.logger.info(f"Detected change in '{file_path}'")
+                self.review(file_path)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                response = await self.handle_request(line)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, line):
+        try:
+            request = json.loads(line)
+            file_path = Path(request["file"]).resolve(strict=True)
+        except (ValueError, KeyError, TypeError) as error:
+            return {"ok": False, "error": f"Invalid request: {error}"}
+        except OSError as error:
+            return {"file": request["file"], "ok": False, "error": str(error)}
+        if file_path.suffix.lower() not in self.supported_extensions:
+            return {
+                "file": str(file_path),
+                "ok": False,
+                "error": f"Unsupported file type: {file_path.suffix}",
+            }
+        review_content = await self.review(file_path)
+        if review_content is None:
+            return {"file": str(file_path), "ok": False, "error": "Review failed"}
+        return {"file": str(file_path), "ok": True, "review": review_content}
+
+    async def serve(self, socket_path):
+        if os.path.exists(socket_path):
+            # Left behind by a daemon that did not shut down cleanly
+            os.unlink(socket_path)
+        server = await asyncio.start_unix_server(self.handle_connection, socket_path)
+        self.logger.info(f"Accepting review requests on '{socket_path}'")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
@@ -0,0 +1,259 @@
+"""
+This module turns review text into structured findings and writes them as JSON Lines or SARIF.
+
+Both writers stream: every finding is written and flushed as soon as its file has
+been reviewed, so the output of a large batch can be consumed while it runs.
+
+Classes:
+    Finding
+    JsonLinesWriter
+    SarifWriter
+
+Functions:
+    split_findings
+    create_writer
+"""
+
+import json
+import re
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+# The review areas of construct_user_prompt, in the order they are listed there
+CATEGORIES = [
+    "Code Efficiency",
+    "Readability and Maintainability",
+    "Design Patterns and Architecture",
+    "Security Vulnerabilities",
+    "Error Handling and Logging",
+    "Testing and Coverage",
+    "Compliance with Best Practices and Standards",
+    "Technical Debt Identification",
+    "Dependencies Management",
+    "Code Patterns and Anti-Patterns",
+]
+GENERAL_CATEGORY = "General"
+SEVERITIES = ("high", "medium", "low")
+SARIF_LEVELS = {"high": "error", "medium": "warning", "low": "note"}
+
+FINDINGS_INSTRUCTIONS = (
+    "\n\nAfter the review of each file, list its findings in a single fenced ```json block "
+    "containing a JSON array. Each element must be an object with the keys "
+    '"start_line" and "end_line" (line numbers as shown in the code, or null), '
+    f'"category" (one of: {", ".join(CATEGORIES)}), '
+    '"severity" ("high", "medium" or "low") and '
+    '"suggestion" (one or two sentences describing the improvement).'
+)
+
+FINDINGS_BLOCK = re.compile(r"```json\s*\n(.*?)\n```", re.DOTALL)
+LINE_REFERENCE = re.compile(
+    r"\blines?\s+(\d+)(?:\s*(?:-|–|to)\s*(\d+))?", re.IGNORECASE
+)
+CATEGORY_HEADING = re.compile(
+    r"^\s*(?:#+\s*)?(?:\d+\.\s*)?\*{0,2}("
+    + "|".join(map(re.escape, CATEGORIES))
+    + r")\*{0,2}",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+@dataclass
+class Finding:
+    file: str
+    start_line: int | None
+    end_line: int | None
+    category: str
+    severity: str
+    suggestion: str
+
+
+def _line(value):
+    try:
+        line = int(value)
+    except (TypeError, ValueError):
+        return None
+    return line if line > 0 else None
+
+
+def _category(value):
+    for category in CATEGORIES:
+        if str(value).strip().lower() == category.lower():
+            return category
+    return GENERAL_CATEGORY
+
+
+def _findings_from_json(items, file):
+    findings = []
+    for item in items:
+        if not isinstance(item, dict) or not item.get("suggestion"):
+            continue
+        start_line = _line(item.get("start_line"))
+        end_line = _line(item.get("end_line")) or start_line
+        severity = str(item.get("severity", "")).lower()
+        findings.append(
+            Finding(
+                file=file,
+                start_line=start_line,
+                end_line=max(end_line, start_line) if start_line else end_line,
+                category=_category(item.get("category")),
+                severity=severity if severity in SEVERITIES else "low",
+                suggestion=str(item["suggestion"]).strip(),
+            )
+        )
+    return findings
+
+
+def _findings_from_text(review, file):
+    """Falls back to one finding per review area that the text has a section for."""
+    headings = list(CATEGORY_HEADING.finditer(review))
+    findings = []
+    for heading, following in zip(headings, headings[1:] + [None]):
+        section = review[heading.end() : following.start() if following else None]
+        section = section.strip(" *:\n")
+        if not section:
+            continue
+        lines = [
+            int(number)
+            for match in LINE_REFERENCE.finditer(section)
+            for number in match.groups()
+            if number
+        ]
+        findings.append(
+            Finding(
+                file=file,
+                start_line=min(lines) if lines else None,
+                end_line=max(lines) if lines else None,
+                category=_category(heading.group(1)),
+                severity="low",
+                suggestion=section,
+            )
+        )
+    return findings
+
+
+def split_findings(review, file):
+    """Returns the review text without its findings blocks, and the findings of file.
+
+    The findings come from the JSON blocks requested by FINDINGS_INSTRUCTIONS (a
+    review merged from chunks has one per chunk). If there is no valid block, they
+    are derived from the review's sections instead.
+    """
+    text_parts = []
+    findings = []
+    found_block = False
+    position = 0
+    for block in FINDINGS_BLOCK.finditer(review):
+        try:
+            items = json.loads(block.group(1))
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(items, list):
+            continue
+        found_block = True
+        text_parts.append(review[position : block.start()])
+        position = block.end()
+        findings.extend(_findings_from_json(items, file))
+    if not found_block:
+        return review, _findings_from_text(review, file)
+    text_parts.append(review[position:])
+    return "".join(text_parts).strip(), findings
+
+
+def display_path(file_path):
+    """Returns file_path relative to the working directory if it is below it."""
+    try:
+        return Path(file_path).resolve().relative_to(Path.cwd()).as_posix()
+    except ValueError:
+        return Path(file_path).as_posix()
+
+
+class JsonLinesWriter:
+    """Writes one JSON object per finding and line."""
+
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8")
+
+    def write(self, findings):
+        for finding in findings:
+            self.file.write(json.dumps(asdict(finding)) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SarifWriter:
+    """Writes a SARIF 2.1.0 log whose results are appended as findings arrive.
+
+    The document is only complete once close() has written its closing brackets.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8")
+        self.results = 0
+        driver = {
+            "name": "RefactorMind",
+            "informationUri": "https://github.com/AbyssalDrifter/RefactorMind",
+            "rules": [
+                {"id": self.rule_id(category), "name": category}
+                for category in CATEGORIES + [GENERAL_CATEGORY]
+            ],
+        }
+        header = json.dumps(
+            {
+                "version": "2.1.0",
+                "$schema": "https://json.schemastore.org/sarif-2.1.0.json",
+                "runs": [{"tool": {"driver": driver}, "results": []}],
+            }
+        )
+        # Leave the results array open so that results can be appended to it
+        self.footer = "]}]}\n"
+        self.file.write(header[: -len("]}]}")])
+        self.file.flush()
+
+    @staticmethod
+    def rule_id(category):
+        return re.sub(r"[^a-z0-9]+", "-", category.lower()).strip("-")
+
+    def write(self, findings):
+        for finding in findings:
+            location = {"artifactLocation": {"uri": finding.file}}
+            if finding.start_line:
+                location["region"] = {
+                    "startLine": finding.start_line,
+                    "endLine": finding.end_line or finding.start_line,
+                }
+            result = {
+                "ruleId": self.rule_id(finding.category),
+                "level": SARIF_LEVELS[finding.severity],
+                "message": {"text": finding.suggestion},
+                "locations": [{"physicalLocation": location}],
+            }
+            self.file.write(("," if self.results else "") + json.dumps(result))
+            self.results += 1
+        self.file.flush()
+
+    def close(self):
+        self.file.write(self.footer)
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def create_writer(path, output_format=None):
+    """Returns the writer for output_format, or guesses it from the file name."""
+    if output_format is None:
+        output_format = "sarif" if ".sarif" in Path(path).name.lower() else "jsonl"
+    if output_format == "sarif":
+        return SarifWriter(path)
+    return JsonLinesWriter(path)
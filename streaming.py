@@ -0,0 +1,72 @@
+"""
+This module consumes streamed chat completions and measures their latency.
+
+Classes:
+    LineBuffer
+    StreamStats
+
+Functions:
+    consume_stream
+"""
+
+import time
+from dataclasses import dataclass
+
+
+class LineBuffer:
+    """Collects streamed text and passes every completed line to emit."""
+
+    def __init__(self, emit):
+        self.emit = emit
+        self.pending = ""
+
+    def write(self, text):
+        self.pending += text
+        *lines, self.pending = self.pending.split("\n")
+        for line in lines:
+            self.emit(line)
+
+    def flush(self):
+        if self.pending:
+            self.emit(self.pending)
+            self.pending = ""
+
+
+@dataclass
+class StreamStats:
+    time_to_first_token: float
+    total_latency: float
+    tokens: int
+
+    @property
+    def tokens_per_second(self):
+        generation_time = self.total_latency - self.time_to_first_token
+        return self.tokens / generation_time if generation_time > 0 else 0.0
+
+
+async def consume_stream(stream, emit, start=None):
+    """Forwards a stream of text deltas to emit line by line.
+
+    `start` is the perf_counter() value at which the request was sent. Every
+    delta counts as one token, which is how the API streams them.
+    Returns the full text and its StreamStats.
+    """
+    start = time.perf_counter() if start is None else start
+    buffer = LineBuffer(emit)
+    parts = []
+    first_token_at = None
+    async for text in stream:
+        if not text:
+            continue
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+        parts.append(text)
+        buffer.write(text)
+    buffer.flush()
+    end = time.perf_counter()
+    stats = StreamStats(
+        time_to_first_token=(first_token_at or end) - start,
+        total_latency=end - start,
+        tokens=len(parts),
+    )
+    return "".join(parts), stats
@@ -0,0 +1,362 @@
+"""
+This module accounts for the tokens, cost and latency of the review requests of a run.
+
+Every request records its prompt and completion tokens (as reported by the
+backend, or estimated if it does not report them), its latency including
+retries, and how often it was retried. Cache hits are counted as well. The
+numbers are aggregated per file, per language and per model, with latency and
+prompt size histograms per language, and can be exported as a JSON summary, as
+a Prometheus textfile (for the node_exporter textfile collector) and as a table.
+
+Classes:
+    RequestMetrics
+    UsageStats
+    Histogram
+    Telemetry
+
+Functions:
+    escape_label
+    prices_for_model
+"""
+
+import bisect
+import json
+import math
+import os
+import time
+from dataclasses import asdict, dataclass
+
+# List prices in USD per million (prompt, completion) tokens; see .env to override
+MODEL_PRICES = {
+    "gpt-4-1106-preview": (10.0, 30.0),
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4o": (5.0, 15.0),
+    "gpt-4-32k": (60.0, 120.0),
+    "gpt-4": (30.0, 60.0),
+    "gpt-3.5-turbo": (0.5, 1.5),
+}
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+TOKEN_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+METRIC_PREFIX = "refactormind"
+
+
+def escape_label(value):
+    """Escapes a Prometheus label value."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prices_for_model(model):
+    """Returns the (prompt, completion) price per million tokens, or None if unknown."""
+    matches = [name for name in MODEL_PRICES if model.startswith(name)]
+    if not matches:
+        return None
+    return MODEL_PRICES[max(matches, key=len)]
+
+
+@dataclass
+class RequestMetrics:
+    """What one request cost, filled in while it is sent."""
+
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency: float = 0.0
+    retries: int = 0
+    # Whether the tokens are estimates because the backend did not report usage
+    estimated: bool = False
+    # Whether the request failed, after all its retries
+    failed: bool = False
+
+
+@dataclass
+class UsageStats:
+    requests: int = 0
+    # Requests that failed after all their retries; they are not billed
+    failures: int = 0
+    cache_hits: int = 0
+    retries: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+    latency: float = 0.0
+    # Requests whose tokens are estimates, see RequestMetrics
+    estimated_requests: int = 0
+
+    def add(self, metrics, cost, share=1.0):
+        """Adds a request, of which `share` is attributed to these stats."""
+        self.requests += 1
+        self.failures += metrics.failed
+        self.retries += metrics.retries
+        self.prompt_tokens += round(metrics.prompt_tokens * share)
+        self.completion_tokens += round(metrics.completion_tokens * share)
+        self.cost += cost * share
+        self.latency += metrics.latency
+        self.estimated_requests += metrics.estimated
+
+
+class Histogram:
+    """Counts observations in buckets with the given upper bounds, like Prometheus."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # The last bucket counts the observations above all bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        """Adds the observations of another histogram with the same bounds."""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the given quantile (the maximum for the last)."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(fraction * self.count))
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def cumulative_counts(self):
+        """Returns (upper bound, observations up to it) pairs, ending with +Inf."""
+        pairs = []
+        cumulative = 0
+        for bound, count in zip(list(self.bounds) + [math.inf], self.counts):
+            cumulative += count
+            pairs.append((bound, cumulative))
+        return pairs
+
+    def to_dict(self):
+        return {
+            "buckets": {
+                ("+Inf" if bound == math.inf else str(bound)): count
+                for bound, count in self.cumulative_counts()
+            },
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+        }
+
+
+class Telemetry:
+    """Aggregates the RequestMetrics and cache hits of a run.
+
+    `prices` overrides the (prompt, completion) price per million tokens of all
+    models. `labels` are added to every exported series, e.g. the repository.
+    """
+
+    def __init__(self, prices=None, labels=None):
+        self.prices = prices
+        self.labels = labels or {}
+        self.started = time.time()
+        self.files = {}
+        self.languages = {}
+        self.models = {}
+        self.latency = {}
+        self.prompt_size = {}
+        # Models without a known price, whose cost is counted as zero
+        self.unpriced_models = set()
+
+    def cost(self, model, metrics):
+        if metrics.failed:
+            return 0.0
+        prices = self.prices or prices_for_model(model)
+        if prices is None:
+            self.unpriced_models.add(model)
+            return 0.0
+        prompt_price, completion_price = prices
+        return (
+            metrics.prompt_tokens * prompt_price
+            + metrics.completion_tokens * completion_price
+        ) / 1_000_000
+
+    def record_request(self, file_paths, language, model, metrics):
+        """Records a request reviewing file_paths; tokens and cost are split evenly."""
+        cost = self.cost(model, metrics)
+        self.languages.setdefault(language, UsageStats()).add(metrics, cost)
+        self.models.setdefault(model, UsageStats()).add(metrics, cost)
+        for file_path in file_paths:
+            self.files.setdefault(str(file_path), UsageStats()).add(
+                metrics, cost, 1 / len(file_paths)
+            )
+        self.latency.setdefault(language, Histogram(LATENCY_BUCKETS)).observe(
+            metrics.latency
+        )
+        self.prompt_size.setdefault(language, Histogram(TOKEN_BUCKETS)).observe(
+            metrics.prompt_tokens
+        )
+
+    def record_cache_hit(self, file_path, language):
+        self.languages.setdefault(language, UsageStats()).cache_hits += 1
+        self.files.setdefault(str(file_path), UsageStats()).cache_hits += 1
+
+    def totals(self):
+        totals = UsageStats()
+        for stats in self.languages.values():
+            for name, value in asdict(stats).items():
+                setattr(totals, name, getattr(totals, name) + value)
+        return totals
+
+    def summary(self):
+        return {
+            "labels": self.labels,
+            "started": self.started,
+            "duration_seconds": time.time() - self.started,
+            "totals": asdict(self.totals()),
+            "unpriced_models": sorted(self.unpriced_models),
+            "models": {model: asdict(stats) for model, stats in self.models.items()},
+            "languages": {
+                language: {
+                    **asdict(stats),
+                    "latency_seconds": self.latency[language].to_dict()
+                    if language in self.latency
+                    else None,
+                    "prompt_tokens_per_request": self.prompt_size[language].to_dict()
+                    if language in self.prompt_size
+                    else None,
+                }
+                for language, stats in self.languages.items()
+            },
+            "files": {path: asdict(stats) for path, stats in self.files.items()},
+        }
+
+    def write_json(self, path):
+        with open(path, "w") as file:
+            json.dump(self.summary(), file, indent=2)
+
+    def _series(self, name, labels, value):
+        labels = {**self.labels, **labels}
+        rendered = ",".join(
+            f'{key}="{escape_label(label)}"' for key, label in labels.items()
+        )
+        return f"{METRIC_PREFIX}_{name}{{{rendered}}} {value}"
+
+    def prometheus_text(self):
+        lines = []
+        counters = [
+            ("requests_total", "requests", "Review requests sent"),
+            ("failures_total", "failures", "Review requests failed after all retries"),
+            ("cache_hits_total", "cache_hits", "Reviews served from the cache"),
+            ("retries_total", "retries", "Retried review requests"),
+            ("prompt_tokens_total", "prompt_tokens", "Prompt tokens sent"),
+            (
+                "completion_tokens_total",
+                "completion_tokens",
+                "Completion tokens received",
+            ),
+            ("cost_usd_total", "cost", "Estimated cost in US dollars"),
+        ]
+        for label_name, groups in (
+            ("language", self.languages),
+            ("model", self.models),
+        ):
+            for name, field, description in counters:
+                if label_name == "model":
+                    name = f"model_{name}"
+                lines.append(
+                    f"# HELP {METRIC_PREFIX}_{name} {description} per {label_name}"
+                )
+                lines.append(f"# TYPE {METRIC_PREFIX}_{name} counter")
+                for key, stats in sorted(groups.items()):
+                    lines.append(
+                        self._series(name, {label_name: key}, getattr(stats, field))
+                    )
+        for name, histograms, description in (
+            ("request_latency_seconds", self.latency, "Latency of review requests"),
+            ("request_prompt_tokens", self.prompt_size, "Prompt tokens per request"),
+        ):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {description}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} histogram")
+            for language, histogram in sorted(histograms.items()):
+                for bound, count in histogram.cumulative_counts():
+                    le = "+Inf" if bound == math.inf else str(bound)
+                    lines.append(
+                        self._series(
+                            f"{name}_bucket", {"language": language, "le": le}, count
+                        )
+                    )
+                lines.append(
+                    self._series(f"{name}_sum", {"language": language}, histogram.sum)
+                )
+                lines.append(
+                    self._series(
+                        f"{name}_count", {"language": language}, histogram.count
+                    )
+                )
+        lines.append(f"# TYPE {METRIC_PREFIX}_last_run_timestamp_seconds gauge")
+        lines.append(self._series("last_run_timestamp_seconds", {}, time.time()))
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Writes the textfile atomically, so the collector never reads half of it."""
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as file:
+            file.write(self.prometheus_text())
+        os.replace(temporary, path)
+
+    def table(self):
+        """Returns the per-language usage as a text table, with a total row."""
+        columns = [
+            ("language", "{}"),
+            ("requests", "{:d}"),
+            ("failed", "{:d}"),
+            ("cache hits", "{:d}"),
+            ("retries", "{:d}"),
+            ("prompt tok", "{:d}"),
+            ("compl. tok", "{:d}"),
+            ("cost ($)", "{:.4f}"),
+            ("p50 (s)", "{:.1f}"),
+            ("p95 (s)", "{:.1f}"),
+        ]
+        rows = []
+        for language, stats in sorted(self.languages.items()):
+            latency = self.latency.get(language, Histogram(LATENCY_BUCKETS))
+            rows.append(self._table_row(language, stats, latency))
+        totals_latency = Histogram(LATENCY_BUCKETS)
+        for histogram in self.latency.values():
+            totals_latency.merge(histogram)
+        rows.append(self._table_row("total", self.totals(), totals_latency))
+        widths = [
+            max(len(title), *(len(fmt.format(row[i])) for row in rows))
+            for i, (title, fmt) in enumerate(columns)
+        ]
+        lines = [
+            "  ".join(title.rjust(width) for (title, _), width in zip(columns, widths))
+        ]
+        for row in rows:
+            lines.append(
+                "  ".join(
+                    fmt.format(value).rjust(width)
+                    for (_, fmt), value, width in zip(columns, row, widths)
+                )
+            )
+        return "\n".join(lines)
+
+    @staticmethod
+    def _table_row(name, stats, latency):
+        return (
+            name,
+            stats.requests,
+            stats.failures,
+            stats.cache_hits,
+            stats.retries,
+            stats.prompt_tokens,
+            stats.completion_tokens,
+            stats.cost,
+            latency.quantile(0.5),
+            latency.quantile(0.95),
+        )
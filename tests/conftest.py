@@ -0,0 +1,33 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The modules live at the top level of the repository, like for the benchmarks
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backends import FakeBackend  # noqa: E402
+
+
+@pytest.fixture
+def fake_backend():
+    """A FakeBackend fast enough for tests, but with a measurable latency."""
+    return FakeBackend(latency=0.05, tokens_per_second=100000, completion_tokens=20)
+
+
+@pytest.fixture
+def python_files(tmp_path):
+    """Writes small Python files and returns their paths, in sorted order."""
+
+    def write(count, lines=3):
+        paths = []
+        for index in range(count):
+            path = tmp_path / f"module_{index:02d}.py"
+            path.write_text(
+                "\n".join(f"value_{index}_{line} = {line}" for line in range(lines))
+                + "\n"
+            )
+            paths.append(path)
+        return paths
+
+    return write
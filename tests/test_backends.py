@@ -0,0 +1,65 @@
+import asyncio
+
+import openai
+import pytest
+
+from backends import FakeBackend, ReviewBackend
+
+MESSAGES = [
+    {"role": "system", "content": "You review code."},
+    {"role": "user", "content": "x = 1"},
+]
+
+
+def test_review_backend_is_abstract():
+    with pytest.raises(TypeError):
+        ReviewBackend()
+
+
+def test_fake_reviews_are_deterministic(fake_backend):
+    first = asyncio.run(fake_backend.complete(MESSAGES, "model", 0))
+    other = FakeBackend(latency=0, tokens_per_second=100000, completion_tokens=20)
+    second = asyncio.run(other.complete(MESSAGES, "model", 0))
+    assert first.content == second.content
+    assert len(first.content.split()) == fake_backend.completion_tokens
+    assert first.prompt_tokens > 0
+    assert len(fake_backend.requests) == 1
+
+
+def test_fake_latency(fake_backend):
+    async def complete():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await fake_backend.complete(MESSAGES, "model", 0)
+        return loop.time() - start
+
+    assert asyncio.run(complete()) >= fake_backend.latency
+
+
+def test_fake_streams_the_same_review(fake_backend):
+    async def stream():
+        deltas = await fake_backend.stream(MESSAGES, "model", 0)
+        return "".join([delta async for delta in deltas])
+
+    completion = asyncio.run(fake_backend.complete(MESSAGES, "model", 0))
+    assert asyncio.run(stream()) == completion.content
+
+
+def test_fake_errors_are_api_errors():
+    backend = FakeBackend(latency=0, error_rate=1.0)
+    for _ in range(5):
+        with pytest.raises((openai.RateLimitError, openai.InternalServerError)):
+            asyncio.run(backend.complete(MESSAGES, "model", 0))
+    assert backend.errors == 5
+
+
+def test_fake_answers_packed_requests_per_file(fake_backend):
+    messages = [
+        MESSAGES[0],
+        {
+            "role": "user",
+            "content": "===== FILE 1: a.py =====\nx\n===== FILE 2: b.py =====\ny",
+        },
+    ]
+    content = asyncio.run(fake_backend.complete(messages, "model", 0)).content
+    assert "===== REVIEW 1 =====" in content and "===== REVIEW 2 =====" in content
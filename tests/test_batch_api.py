@@ -0,0 +1,149 @@
+import asyncio
+import json
+import logging
+from pathlib import Path
+
+import pytest
+
+from batch_api import (
+    BATCH_ENDPOINT,
+    BatchJob,
+    BatchRequest,
+    collect_batch,
+    parse_results,
+    requests_path,
+    results_path,
+    submit_batch,
+    write_requests,
+)
+from code_review import ReviewerFactory
+from review_cache import ReviewCache
+
+LOGGER = logging.getLogger(__name__)
+
+
+def test_job_state_round_trips(tmp_path):
+    job = BatchJob("gpt-4o", input_file_id="file-1")
+    job.files["a.py"] = [BatchRequest("request-0", "key", [1, 20], cached=True)]
+    path = tmp_path / "job.json"
+    job.save(path)
+    assert BatchJob.load(path) == job
+    assert not Path(f"{path}.tmp").exists()
+
+
+def test_write_requests(tmp_path):
+    path = tmp_path / "requests.jsonl"
+    write_requests(path, [("request-0", {"model": "m"}), ("request-1", {})])
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["custom_id"] for line in lines] == ["request-0", "request-1"]
+    assert lines[0]["url"] == BATCH_ENDPOINT and lines[0]["body"] == {"model": "m"}
+
+
+def test_parse_results():
+    def line(custom_id, status_code, content=None):
+        body = {"choices": [{"message": {"content": content}}]} if content else {}
+        return json.dumps(
+            {
+                "custom_id": custom_id,
+                "response": {"status_code": status_code, "body": body},
+            }
+        )
+
+    text = "\n".join(
+        [line("request-0", 200, "Review"), line("request-1", 429), "", line("x", 200)]
+    )
+    assert parse_results(text) == {
+        "request-0": "Review",
+        "request-1": None,
+        "x": None,
+    }
+
+
+def test_paths_next_to_the_state():
+    assert results_path("jobs/nightly.json") == Path("jobs/nightly.results.jsonl")
+    assert requests_path("jobs/nightly.json") == Path("jobs/nightly.requests.jsonl")
+
+
+@pytest.fixture
+def factory(fake_backend, tmp_path):
+    factory = ReviewerFactory(
+        fake_backend, cache=ReviewCache(tmp_path / "cache.sqlite3")
+    )
+    yield factory
+    factory.cache.close()
+
+
+def submit(factory, file_paths, state_path):
+    return asyncio.run(submit_batch(factory, file_paths, "gpt-4o", state_path, LOGGER))
+
+
+def collect(factory, state_path):
+    return asyncio.run(collect_batch(factory, state_path, LOGGER))
+
+
+def test_submission_resumes_after_a_crash_and_is_collected(
+    factory, python_files, tmp_path, monkeypatch
+):
+    backend = factory.backend
+    file_paths = python_files(3)
+    state_path = tmp_path / "job.json"
+    create_batch = backend.create_batch
+
+    async def crash(*args):
+        raise KeyboardInterrupt
+
+    # The process dies after uploading the input file, before creating the batch
+    monkeypatch.setattr(backend, "create_batch", crash)
+    with pytest.raises(KeyboardInterrupt):
+        submit(factory, file_paths, state_path)
+    assert BatchJob.load(state_path).input_file_id == "file-0"
+
+    monkeypatch.setattr(backend, "create_batch", create_batch)
+    job = submit(factory, file_paths, state_path)
+    # The uploaded input file is reused
+    assert len(backend.files) == 1
+    assert job.batch_id == "batch-0"
+    assert len(job.requests) == 3
+
+    job, reviews = collect(factory, state_path)
+    assert job.status == "completed"
+    assert list(reviews) == file_paths
+    assert all(review.startswith("finding-") for review in reviews.values())
+    assert factory.cache.stats()["stores"] == 3
+    # Results are downloaded once, collecting again reads them from disk
+    assert collect(factory, state_path)[1] == reviews
+
+    # Everything is cached now, so there is nothing left to submit
+    assert submit(factory, file_paths, state_path).batch_id is None
+    assert len(backend.batches) == 1
+
+
+def test_a_job_of_cached_reviews_is_not_resumed(factory, python_files, tmp_path):
+    first, second = python_files(2)
+    state_path = tmp_path / "job.json"
+    submit(factory, [first], state_path)
+    collect(factory, state_path)
+    assert submit(factory, [first], state_path).status == "completed"
+
+    job = submit(factory, [second], state_path)
+    assert job.batch_id == "batch-1"
+    assert list(job.files) == [str(second)]
+    batch_input = factory.backend.files[
+        factory.backend.batches["batch-1"]["input_file_id"]
+    ]
+    assert len(batch_input.splitlines()) == 1
+    assert "value_1_0" in batch_input and "value_0_0" not in batch_input
+
+
+def test_a_pending_batch_is_not_replaced(factory, python_files, tmp_path):
+    state_path = tmp_path / "job.json"
+    submit(factory, python_files(2), state_path)
+    with pytest.raises(ValueError):
+        submit(factory, python_files(2), state_path)
+
+
+def test_an_unsubmitted_batch_cannot_be_collected(factory, tmp_path):
+    state_path = tmp_path / "job.json"
+    BatchJob("gpt-4o").save(state_path)
+    with pytest.raises(ValueError):
+        collect(factory, state_path)
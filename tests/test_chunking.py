@@ -0,0 +1,102 @@
+from chunking import (
+    DEFAULT_CHUNK_SETTINGS,
+    ChunkSettings,
+    block_boundaries,
+    count_tokens,
+    settings_for_model,
+    split_into_chunks,
+)
+
+
+def python_source(functions, body_lines):
+    return "\n".join(
+        f"def function_{index}():\n"
+        + "\n".join(f"    value = {line}" for line in range(body_lines))
+        for index in range(functions)
+    )
+
+
+def test_count_tokens_estimates_without_a_tokenizer():
+    assert count_tokens("") == 0
+    assert count_tokens("abcd") == 1
+    assert count_tokens("abcde") == 2
+
+
+def test_settings_for_model_matches_the_longest_prefix():
+    assert settings_for_model("gpt-4-32k-0613").max_tokens == 12000
+    assert settings_for_model("gpt-4-0613").max_tokens == 3000
+    assert settings_for_model("gpt-4o-2024-05-13").max_tokens == 24000
+    assert settings_for_model("unknown-model") == DEFAULT_CHUNK_SETTINGS
+
+
+def test_python_boundaries_include_decorators():
+    source = (
+        "import os\n\n@decorator\ndef first():\n    pass\n\nclass Second:\n    pass\n"
+    )
+    assert block_boundaries(source, ".py") == [1, 3, 7]
+
+
+def test_brace_boundaries_ignore_braces_in_strings_and_comments():
+    source = (
+        'const text = "{";\n'
+        "// }\n"
+        "function first() {\n"
+        "  return '}';\n"
+        "}\n"
+        "/* { */\n"
+        "function second() {}\n"
+    )
+    # Lines holding only a comment do not start a block
+    assert block_boundaries(source, ".ts") == [1, 3, 7]
+
+
+def test_unknown_languages_have_a_single_block():
+    assert block_boundaries("a\nb\n", ".txt") == [1]
+
+
+def test_small_source_is_a_single_chunk():
+    source = python_source(2, 2)
+    assert split_into_chunks(source, ".py", ChunkSettings(max_tokens=1000)) == [
+        (1, len(source.splitlines()))
+    ]
+
+
+def test_empty_source_has_no_chunks():
+    assert split_into_chunks("", ".py", ChunkSettings(max_tokens=10)) == []
+
+
+def test_chunks_end_at_block_boundaries_and_cover_every_line():
+    source = python_source(6, 4)
+    settings = ChunkSettings(max_tokens=40, overlap_lines=0)
+    chunks = split_into_chunks(source, ".py", settings)
+    boundaries = block_boundaries(source, ".py")
+    assert len(chunks) > 1
+    assert chunks[0][0] == 1
+    assert chunks[-1][1] == len(source.splitlines())
+    for (_, end), (start, _) in zip(chunks, chunks[1:]):
+        assert start == end + 1
+        assert start in boundaries
+
+
+def test_chunks_after_the_first_repeat_the_overlap():
+    source = python_source(6, 4)
+    without = split_into_chunks(source, ".py", ChunkSettings(40, overlap_lines=0))
+    with_overlap = split_into_chunks(source, ".py", ChunkSettings(40, overlap_lines=2))
+    assert with_overlap[0] == without[0]
+    for (start, end), (overlap_start, overlap_end) in zip(
+        without[1:], with_overlap[1:]
+    ):
+        assert (overlap_start, overlap_end) == (start - 2, end)
+
+
+def test_a_block_larger_than_the_budget_is_split_by_lines():
+    source = python_source(1, 100)
+    settings = ChunkSettings(max_tokens=50, overlap_lines=0)
+    chunks = split_into_chunks(source, ".py", settings)
+    lines = source.splitlines()
+    assert len(chunks) > 1
+    for start, end in chunks:
+        numbered = "".join(
+            f"{number}: {lines[number - 1]}\n" for number in range(start, end + 1)
+        )
+        assert count_tokens(numbered) <= settings.max_tokens
@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from backends import FakeBackend
+from chunking import ChunkSettings
+import backends
+from code_review import (
+    ReviewerFactory,
+    create_backend,
+    collect_files,
+    duplicate_findings,
+    main,
+    parse_arguments,
+    review_files,
+)
+from dedup import DuplicateGroup
+from request_layer import RequestLayer, RetryPolicy
+from review_cache import ReviewCache
+from review_output import Finding
+from telemetry import Telemetry
+
+MODEL = "gpt-4o"
+
+
+def run(factory, file_paths, **kwargs):
+    return asyncio.run(review_files(factory, file_paths, MODEL, **kwargs))
+
+
+def logged_reviews(caplog):
+    return [
+        record.getMessage()
+        for record in caplog.records
+        if record.getMessage().startswith("Review of")
+    ]
+
+
+def test_reviews_run_concurrently(python_files):
+    file_paths = python_files(8)
+    backend = FakeBackend(latency=0.2, tokens_per_second=100000, completion_tokens=20)
+    start = time.perf_counter()
+    assert run(ReviewerFactory(backend), file_paths, concurrency=8) == 0
+    assert time.perf_counter() - start < 8 * 0.2 / 2
+    assert len(backend.requests) == 8
+
+
+def test_concurrency_limits_the_requests_in_flight(python_files):
+    file_paths = python_files(4)
+    backend = FakeBackend(latency=0.1, tokens_per_second=100000, completion_tokens=20)
+    start = time.perf_counter()
+    run(ReviewerFactory(backend), file_paths, concurrency=1)
+    assert time.perf_counter() - start >= 4 * 0.1
+
+
+def test_reviews_are_logged_in_input_order(python_files, caplog):
+    file_paths = python_files(6)
+    caplog.set_level(logging.INFO, logger="code_review")
+    backend = FakeBackend(latency=0.05, tokens_per_second=100000, completion_tokens=20)
+    run(ReviewerFactory(backend), list(reversed(file_paths)), concurrency=6)
+    assert logged_reviews(caplog) == [
+        f"Review of '{path}'" for path in reversed(file_paths)
+    ]
+
+
+def test_cached_reviews_are_not_requested_again(python_files, fake_backend, tmp_path):
+    file_paths = python_files(3)
+    cache = ReviewCache(str(tmp_path / "cache.sqlite3"))
+    telemetry = Telemetry()
+    factory = ReviewerFactory(fake_backend, cache=cache, telemetry=telemetry)
+    run(factory, file_paths)
+    run(factory, file_paths)
+    assert len(fake_backend.requests) == 3
+    assert cache.stats()["hits"] == 3
+    assert telemetry.totals().cache_hits == 3
+
+
+def test_large_files_are_reviewed_in_chunks(tmp_path, fake_backend, caplog):
+    path = tmp_path / "large.py"
+    path.write_text(
+        "\n\n".join(f"def function_{i}():\n    return {i}" for i in range(40))
+    )
+    caplog.set_level(logging.INFO, logger="code_review")
+    factory = ReviewerFactory(
+        fake_backend, chunk_settings=ChunkSettings(max_tokens=100, overlap_lines=0)
+    )
+    assert run(factory, [path]) == 0
+    assert len(fake_backend.requests) > 1
+    review = caplog.records[-1].getMessage()
+    assert review.count("## Lines ") == len(fake_backend.requests)
+
+
+def test_small_files_are_packed(python_files, fake_backend):
+    file_paths = python_files(4)
+    assert run(ReviewerFactory(fake_backend), file_paths, pack_tokens=8000) == 0
+    assert len(fake_backend.requests) == 1
+
+
+def test_failed_reviews_are_counted(python_files):
+    file_paths = python_files(3)
+    telemetry = Telemetry()
+    factory = ReviewerFactory(
+        FakeBackend(latency=0, error_rate=1.0),
+        request_layer=RequestLayer(
+            retry_policy=RetryPolicy(max_retries=1, base_delay=0)
+        ),
+        telemetry=telemetry,
+    )
+    assert run(factory, file_paths) == 3
+    totals = telemetry.totals()
+    assert (totals.requests, totals.failures, totals.retries) == (3, 3, 3)
+
+
+def test_collect_files_skips_hidden_and_unsupported_files(tmp_path):
+    for name in ["a.py", "b.txt", "sub/c.ts", ".venv/d.py", "sub/.e.py"]:
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_text("x = 1\n")
+    extensions = ReviewerFactory(None).supported_extensions()
+    assert collect_files(tmp_path, "*", extensions) == [
+        tmp_path / "a.py",
+        tmp_path / "sub" / "c.ts",
+    ]
+
+
+def test_duplicate_findings_map_near_duplicate_lines(tmp_path):
+    representative = tmp_path / "a.py"
+    copy = tmp_path / "b.py"
+    near = tmp_path / "c.py"
+    source = "".join(f"value_{i} = {i}\n" for i in range(10))
+    representative.write_text(source)
+    copy.write_text(source)
+    near.write_text("import os\n" + source.replace("value_5 = 5", "value_5 = 6"))
+    group = DuplicateGroup(representative, [copy], [(near, 0.9)])
+    findings = [
+        Finding(str(representative), 2, 3, "General", "low", "A"),
+        Finding(str(representative), 6, 6, "General", "low", "B"),
+    ]
+    assert [
+        (f.start_line, f.end_line) for f in duplicate_findings(findings, group, copy)
+    ] == [(2, 3), (6, 6)]
+    assert [
+        (f.start_line, f.end_line) for f in duplicate_findings(findings, group, near)
+    ] == [(3, 4), (None, None)]
+
+
+@pytest.mark.parametrize(
+    "arguments",
+    [
+        ["--watch", ".", "--output", "findings.jsonl"],
+        ["--serve", "review.sock", "--pack"],
+        ["--serve", "review.sock", "--file", "a.py"],
+        ["--batch", "submit", "--path", ".", "--stream"],
+        ["--batch", "collect", "--path", "."],
+        ["--batch", "submit", "--path", ".", "--backend", "fake"],
+        ["--path", ".", "--concurrency", "0"],
+        [],
+    ],
+)
+def test_invalid_argument_combinations_are_rejected(arguments, monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["code_review.py", *arguments])
+    with pytest.raises(SystemExit):
+        parse_arguments()
+
+
+def test_valid_arguments(monkeypatch):
+    monkeypatch.setattr(
+        sys, "argv", ["code_review.py", "--watch", ".", "--serve", "review.sock"]
+    )
+    args = parse_arguments()
+    assert (args.watch, args.serve) == (".", "review.sock")
+    assert Path(args.watch).is_dir()
+
+
+@pytest.mark.parametrize(
+    "arguments",
+    [
+        ["--batch", "collect"],
+        ["--batch", "collect", "--batch-wait", "600", "--output", "findings.jsonl"],
+        ["--batch", "submit", "--path", ".", "--triage"],
+    ],
+)
+def test_valid_batch_arguments(arguments, monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["code_review.py", *arguments])
+    assert parse_arguments().batch == arguments[1]
+
+
+def test_the_fake_backend_is_selectable(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["code_review.py", "--path", "."])
+    assert parse_arguments().backend == "openai"
+    monkeypatch.setattr(
+        sys, "argv", ["code_review.py", "--path", ".", "--backend", "fake"]
+    )
+    assert isinstance(create_backend(parse_arguments(), None), FakeBackend)
+
+
+@pytest.fixture
+def run_cli(tmp_path, monkeypatch):
+    """Runs code_review.py in tmp_path with a fast fake backend.
+
+    Returns the exit code and the log of the run.
+    """
+    (tmp_path / ".env").write_text(
+        f"OPENAI_MODEL=gpt-4o\nLOG_FILE={tmp_path / 'run.log'}\n"
+        f"CACHE_FILE={tmp_path / 'cache.sqlite3'}\n"
+    )
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(
+        backends,
+        "FakeBackend",
+        lambda: FakeBackend(latency=0, tokens_per_second=100000, completion_tokens=20),
+    )
+    logger = logging.getLogger("code_review")
+
+    def run(*arguments):
+        handlers = list(logger.handlers)
+        monkeypatch.setattr(
+            sys, "argv", ["code_review.py", "--backend", "fake", *arguments]
+        )
+        try:
+            main()
+            code = 0
+        except SystemExit as exit:
+            code = exit.code
+        finally:
+            for handler in set(logger.handlers) - set(handlers):
+                handler.close()
+                logger.removeHandler(handler)
+        return code, (tmp_path / "run.log").read_text()
+
+    return run
+
+
+@pytest.mark.parametrize("git", [False, True])
+@pytest.mark.parametrize("target", [["--file", "src/m1.py"], ["--path", "src/m1.py"]])
+def test_a_single_file_is_reviewed_end_to_end(run_cli, tmp_path, target, git):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "m1.py").write_text("def f(x):\n    return x + 1\n")
+    if git:
+        subprocess.run(["git", "init", "-q", str(tmp_path)], check=True)
+    code, log = run_cli(*target)
+    assert code == 0, log
+    assert "Review Content:" in log
+    assert "An unexpected error occurred" not in log
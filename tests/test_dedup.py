@@ -0,0 +1,102 @@
+from pathlib import Path
+
+from dedup import (
+    NUM_PERMUTATIONS,
+    find_duplicates,
+    map_lines,
+    minhash_signature,
+    signatures_of,
+    similarity,
+    tokenize,
+)
+
+
+def module(lines, offset=0):
+    return "".join(
+        f"def function_{i}(value):\n    return value * {i + offset}\n\n"
+        for i in range(lines)
+    )
+
+
+def test_signatures_are_deterministic_and_complete():
+    tokens = tokenize("x = 1")
+    signature = minhash_signature(tokens)
+    assert len(signature) == NUM_PERMUTATIONS
+    assert signature == minhash_signature(tokens)
+    assert signatures_of(["x = 1"], workers=1) == [signature]
+
+
+def test_similarity_estimates_shingle_overlap():
+    source = module(100)
+    assert (
+        similarity(
+            minhash_signature(tokenize(source)), minhash_signature(tokenize(source))
+        )
+        == 1.0
+    )
+    edited = source.replace("return value * 50", "return value + 50")
+    assert (
+        similarity(
+            minhash_signature(tokenize(source)), minhash_signature(tokenize(edited))
+        )
+        >= 0.85
+    )
+    other = "".join(f"class Model{i}:\n    name = 'model {i}'\n" for i in range(100))
+    assert (
+        similarity(
+            minhash_signature(tokenize(source)), minhash_signature(tokenize(other))
+        )
+        < 0.2
+    )
+
+
+def test_find_duplicates_groups_copies_and_near_duplicates():
+    source = module(100)
+    sources = {
+        Path("a/util.py"): source,
+        Path("b/util.py"): source.replace("\n", "  \r\n"),
+        Path("c/util.py"): source.replace("return value * 50", "return value + 50"),
+        Path("d/other.py"): module(100, offset=1000),
+        Path("e/util.ts"): source,
+    }
+    groups = find_duplicates(sources)
+    assert len(groups) == 1
+    group = groups[0]
+    assert group.representative == Path("a/util.py")
+    assert group.copies == [Path("b/util.py")]
+    assert [path for path, _ in group.near_duplicates] == [Path("c/util.py")]
+    assert group.members() == [Path("b/util.py"), Path("c/util.py")]
+
+
+def test_find_duplicates_respects_the_threshold():
+    source = module(100)
+    sources = {
+        Path("a.py"): source,
+        Path("b.py"): source.replace("return value * 50", "return value + 50"),
+    }
+    assert find_duplicates(sources, threshold=1.0) == []
+
+
+def test_map_lines_follows_inserted_and_changed_lines():
+    source = "a\nb\nc\nd\n"
+    other = "header\na\nb\nchanged\nd\n"
+    assert map_lines(source, other) == {1: 2, 2: 3, 4: 5}
+
+
+def test_find_duplicates_does_not_chain_gradual_edits():
+    # Each file edits a few more functions of the previous one
+    sources = {}
+    source = module(100)
+    for index in range(8):
+        sources[Path(f"m{index}.py")] = source
+        for function in range(index * 4, index * 4 + 4):
+            source = source.replace(
+                f"return value * {function}\n", f"return value - {function}\n"
+            )
+    signatures = dict(zip(sources, signatures_of(list(sources.values()), workers=1)))
+    groups = find_duplicates(sources, threshold=0.9, workers=1)
+    assert len(groups) > 1
+    for group in groups:
+        for path, score in group.near_duplicates:
+            assert score >= 0.9
+            assert similarity(signatures[group.representative], signatures[path]) >= 0.9
@@ -0,0 +1,114 @@
+import subprocess
+
+import pytest
+
+from git_diff import (
+    changed_files,
+    expand_ranges,
+    number_excerpt,
+    parse_revision_range,
+    read_revision,
+    repository_root,
+)
+
+
+def git(repo, *args):
+    subprocess.run(
+        ["git", "-c", "user.name=Test", "-c", "user.email=test@example.com", *args],
+        cwd=repo,
+        check=True,
+        capture_output=True,
+    )
+
+
+@pytest.fixture
+def repo(tmp_path):
+    git(tmp_path, "init", "-q")
+    (tmp_path / "kept.py").write_text("".join(f"line {i}\n" for i in range(1, 21)))
+    (tmp_path / "removed.py").write_text("gone\n")
+    git(tmp_path, "add", ".")
+    git(tmp_path, "commit", "-q", "-m", "base")
+    return tmp_path
+
+
+def test_parse_revision_range():
+    assert parse_revision_range("main..HEAD") == ("main", "HEAD")
+    assert parse_revision_range("main..") == ("main", None)
+    for spec in ("main", "..HEAD"):
+        with pytest.raises(ValueError):
+            parse_revision_range(spec)
+
+
+def test_expand_ranges_widens_clamps_and_merges():
+    assert expand_ranges([(10, 10), (3, 4)], 2, 100) == [(1, 6), (8, 12)]
+    assert expand_ranges([(5, 5), (9, 9)], 2, 100) == [(3, 11)]
+    assert expand_ranges([(19, 20)], 5, 20) == [(14, 20)]
+
+
+def test_number_excerpt_marks_omitted_lines():
+    source = "".join(f"line {i}\n" for i in range(1, 11))
+    assert number_excerpt(source, [(3, 4), (7, 7)]) == (
+        "...\n3: line 3\n4: line 4\n...\n7: line 7\n..."
+    )
+    assert number_excerpt(source, [(1, 10)]).startswith("1: line 1")
+
+
+def test_changed_files_reports_hunks_of_the_new_revision(repo):
+    lines = [f"line {i}\n" for i in range(1, 21)]
+    lines[4] = "changed 5\n"
+    lines.insert(15, "added\n")
+    (repo / "kept.py").write_text("".join(lines))
+    (repo / "removed.py").unlink()
+    (repo / "new.py").write_text("a\nb\n")
+    git(repo, "add", "-A")
+    git(repo, "commit", "-q", "-m", "change")
+
+    root = repository_root(repo)
+    changes = {
+        change.path.name: change.hunks
+        for change in changed_files(root, "HEAD~1", "HEAD")
+    }
+    assert changes == {"kept.py": [(5, 5), (16, 16)], "new.py": [(1, 2)]}
+    assert read_revision(root, "HEAD~1", root / "kept.py").startswith("line 1\n")
+
+
+def test_changed_files_against_the_working_tree(repo):
+    (repo / "kept.py").write_text("first\n" + (repo / "kept.py").read_text())
+    changes = changed_files(repository_root(repo), "HEAD", None)
+    assert [(change.path.name, change.hunks) for change in changes] == [
+        ("kept.py", [(1, 1)])
+    ]
+
+
+def test_outside_a_repository_git_errors_are_value_errors(tmp_path):
+    with pytest.raises(ValueError):
+        repository_root(tmp_path)
+
+
+def test_three_dots_compare_with_the_merge_base(repo):
+    git(repo, "checkout", "-q", "-b", "feature")
+    (repo / "kept.py").write_text("changed\n")
+    git(repo, "commit", "-q", "-am", "feature")
+    feature = subprocess.run(
+        ["git", "rev-parse", "HEAD~1"], cwd=repo, capture_output=True, text=True
+    ).stdout.strip()
+    git(repo, "checkout", "-q", "-")
+    (repo / "removed.py").write_text("main\n")
+    git(repo, "commit", "-q", "-am", "main")
+    # The merge base is the commit both branches started from
+    assert parse_revision_range("HEAD...feature", repo) == (feature, "feature")
+    assert parse_revision_range("feature...", repo)[1] is None
+
+
+def test_changed_files_with_non_ascii_and_quoted_names(repo):
+    for name in ("café.py", 'say "hi".py', "my file.py"):
+        (repo / name).write_text("a = 1\n")
+    git(repo, "add", ".")
+    git(repo, "commit", "-q", "-m", "names")
+    for name in ("café.py", 'say "hi".py', "my file.py"):
+        (repo / name).write_text("a = 2\n")
+    assert sorted(change.path for change in changed_files(repo, "HEAD", None)) == [
+        repo / "café.py",
+        repo / "my file.py",
+        repo / 'say "hi".py',
+    ]
@@ -0,0 +1,66 @@
+from pathlib import Path
+
+from packing import (
+    MAX_FILES_PER_PACK,
+    SMALL_FILE_TOKENS,
+    PackingStats,
+    pack_code,
+    plan_packs,
+    split_pack_review,
+)
+
+
+def test_plan_packs_groups_small_files_by_extension():
+    files = [
+        (Path("a.py"), 100),
+        (Path("b.ts"), 100),
+        (Path("c.py"), 100),
+        (Path("d.ts"), 100),
+        (Path("large.py"), SMALL_FILE_TOKENS + 1),
+    ]
+    packs = plan_packs(files, max_tokens=1000)
+    assert [(pack.extension, pack.file_paths, pack.tokens) for pack in packs] == [
+        (".py", [Path("a.py"), Path("c.py")], 200),
+        (".ts", [Path("b.ts"), Path("d.ts")], 200),
+    ]
+
+
+def test_plan_packs_respects_the_token_and_file_limits():
+    files = [(Path(f"{index}.py"), 300) for index in range(5)]
+    packs = plan_packs(files, max_tokens=700)
+    assert [len(pack.file_paths) for pack in packs] == [2, 2]
+    assert all(pack.tokens <= 700 for pack in packs)
+
+    files = [(Path(f"{index}.py"), 1) for index in range(MAX_FILES_PER_PACK + 1)]
+    assert [len(pack.file_paths) for pack in plan_packs(files)] == [MAX_FILES_PER_PACK]
+
+
+def test_plan_packs_leaves_single_files_alone():
+    assert plan_packs([(Path("a.py"), 10), (Path("b.ts"), 10)]) == []
+
+
+def test_pack_code_numbers_the_files():
+    assert pack_code("python", [("a.py", "1: x"), ("b.py", "1: y")]) == (
+        "===== FILE 1: a.py =====\n```python\n1: x\n```\n\n"
+        "===== FILE 2: b.py =====\n```python\n1: y\n```"
+    )
+
+
+def test_split_pack_review_by_markers():
+    review = (
+        "Intro that is ignored\n"
+        "===== REVIEW 2 =====\nSecond file\n"
+        "== REVIEW 1 ==\nFirst file\n"
+        "===== REVIEW 7 =====\nOut of range\n"
+        "===== REVIEW 3 =====\n\n"
+    )
+    assert split_pack_review(review, 3) == ["First file", "Second file", None]
+
+
+def test_split_pack_review_without_markers():
+    assert split_pack_review("One review for everything", 2) == [None, None]
+
+
+def test_saved_ratio():
+    assert PackingStats().saved_ratio == 0.0
+    assert PackingStats(single_tokens=1000, packed_tokens=250).saved_ratio == 0.75
@@ -0,0 +1,111 @@
+from pathlib import Path
+
+from pre_analysis import FileMetrics, analyze_file, analyze_files, git_churn, prioritize
+
+
+def write(tmp_path, name, source):
+    path = tmp_path / name
+    path.write_text(source)
+    return path
+
+
+def test_python_metrics(tmp_path):
+    path = write(
+        tmp_path,
+        "app.py",
+        '"""Module docstring\nspanning lines."""\n'
+        "# A comment\n"
+        "\n"
+        "def check(values):\n"
+        '    """Docstring."""\n'
+        "    for value in values:\n"
+        "        if value and value > 1:\n"
+        "            return [v for v in values if v]\n"
+        "    return None\n",
+    )
+    metrics = analyze_file(path)
+    assert metrics.code_lines == 5
+    # for, if, and, the comprehension and its if
+    assert metrics.complexity == 6
+    assert not metrics.stub
+    assert metrics.tokens > 0
+
+
+def test_python_stubs(tmp_path):
+    path = write(
+        tmp_path,
+        "__init__.py",
+        '"""Package."""\nfrom .a import b\nimport os\n__all__ = ["b"]\n',
+    )
+    assert analyze_file(path).stub
+
+
+def test_syntax_errors_fall_back_to_the_lexer(tmp_path):
+    metrics = analyze_file(write(tmp_path, "broken.py", "def broken(:\n    pass\n"))
+    assert metrics.error is None
+    assert metrics.code_lines == 2
+
+
+def test_brace_language_metrics(tmp_path):
+    path = write(
+        tmp_path,
+        "app.ts",
+        "// if in a comment\n"
+        "const text = 'if (x)';\n"
+        "function f(a?: number) {\n"
+        "  if (a && a > 1) { return a ?? 0; }\n"
+        "  return a?.valueOf() ? 1 : 2;\n"
+        "}\n",
+    )
+    metrics = analyze_file(path)
+    assert metrics.code_lines == 5
+    # if, &&, ??, and the ternary
+    assert metrics.complexity == 5
+    reexports = write(tmp_path, "index.ts", "export { a } from './a';\nimport './b';\n")
+    assert analyze_file(reexports).stub
+
+
+def test_unreadable_files_report_an_error(tmp_path):
+    metrics = analyze_file(tmp_path / "missing.py")
+    assert metrics.error is not None
+
+
+def test_analyze_files_keeps_the_order(tmp_path):
+    paths = [write(tmp_path, f"{i}.py", "x = 1\n" * (i + 1)) for i in range(3)]
+    assert [m.code_lines for m in analyze_files(paths, workers=1)] == [1, 2, 3]
+
+
+def test_prioritize_orders_by_risk_within_the_budget():
+    metrics = [
+        FileMetrics(Path("stub.py"), code_lines=10, stub=True),
+        FileMetrics(Path("tiny.py"), code_lines=2),
+        FileMetrics(Path("simple.py"), code_lines=50, tokens=100),
+        FileMetrics(Path("complex.py"), code_lines=50, tokens=100, complexity=20),
+        FileMetrics(Path("churned.py"), code_lines=50, tokens=100, churn=20),
+        FileMetrics(Path("huge.py"), code_lines=50, tokens=10_000, complexity=30),
+        FileMetrics(Path("unreadable.py"), error="denied"),
+    ]
+    selected, trivial, over_budget = prioritize(
+        metrics, min_lines=3, token_budget=400, overhead_tokens=50
+    )
+    assert [m.path.name for m in selected] == [
+        "complex.py",
+        "churned.py",
+        "unreadable.py",
+    ]
+    assert [m.path.name for m in trivial] == ["stub.py", "tiny.py"]
+    assert [m.path.name for m in over_budget] == ["huge.py", "simple.py"]
+
+
+def test_prioritize_by_complexity():
+    metrics = [
+        FileMetrics(Path("a.py"), code_lines=10, complexity=1),
+        FileMetrics(Path("b.py"), code_lines=10, complexity=3),
+    ]
+    selected, trivial, _ = prioritize(metrics, min_complexity=2)
+    assert [m.path.name for m in selected] == ["b.py"]
+    assert [m.path.name for m in trivial] == ["a.py"]
+
+
+def test_churn_outside_a_repository_is_empty(tmp_path):
+    assert git_churn(tmp_path) == {}
@@ -0,0 +1,231 @@
+import asyncio
+import email.utils
+import http.server
+import json
+import threading
+import time
+
+import httpx
+import openai
+import pytest
+
+from backends import OpenAIBackend
+from code_review import create_client
+from request_layer import RequestLayer, RetryPolicy, TokenBucket, retry_after
+
+MESSAGES = [{"role": "user", "content": "x = 1"}]
+
+NO_DELAY = RetryPolicy(max_retries=2, base_delay=0.0, max_delay=0.0)
+
+
+def status_error(status_code, headers=None):
+    request = httpx.Request("POST", "https://api.invalid/v1/chat/completions")
+    response = httpx.Response(status_code, headers=headers, request=request)
+    error_class = {
+        400: openai.BadRequestError,
+        429: openai.RateLimitError,
+    }.get(status_code, openai.InternalServerError)
+    return error_class("error", response=response, body=None)
+
+
+def failing(errors, result="ok"):
+    """Returns a request raising the given errors on its first calls, and its call log."""
+    calls = []
+
+    def request():
+        async def attempt():
+            calls.append(time.monotonic())
+            if len(calls) <= len(errors):
+                raise errors[len(calls) - 1]
+            return result
+
+        return attempt()
+
+    return request, calls
+
+
+def test_retry_after_headers():
+    assert retry_after(status_error(429, {"retry-after-ms": "250"})) == 0.25
+    assert retry_after(status_error(429, {"retry-after": "3"})) == 3.0
+    assert retry_after(status_error(429)) is None
+    assert retry_after(ValueError("no response")) is None
+    later = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 25 <= retry_after(status_error(429, {"retry-after": later})) <= 30
+
+
+def test_call_retries_transient_errors():
+    request, calls = failing([status_error(429), status_error(503)])
+    retries = []
+    layer = RequestLayer(retry_policy=NO_DELAY)
+    result = asyncio.run(
+        layer.call(request, on_retry=lambda error, delay: retries.append(delay))
+    )
+    assert result == "ok"
+    assert len(calls) == 3
+    assert retries == [0.0, 0.0]
+    assert layer.retries == 2
+
+
+def test_call_waits_as_long_as_the_server_asks():
+    request, calls = failing([status_error(429, {"retry-after-ms": "200"})])
+    asyncio.run(RequestLayer(retry_policy=NO_DELAY).call(request))
+    assert calls[1] - calls[0] >= 0.2
+
+
+def test_call_does_not_retry_client_errors():
+    request, calls = failing([status_error(400)])
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(RequestLayer(retry_policy=NO_DELAY).call(request))
+    assert len(calls) == 1
+
+
+def test_call_gives_up_after_max_retries():
+    request, calls = failing([status_error(503)] * 5)
+    with pytest.raises(openai.InternalServerError):
+        asyncio.run(RequestLayer(retry_policy=NO_DELAY).call(request))
+    assert len(calls) == NO_DELAY.max_retries + 1
+
+
+def test_backoff_is_capped():
+    policy = RetryPolicy(base_delay=1.0, max_delay=5.0)
+    assert all(0 <= policy.backoff(attempt) <= 5.0 for attempt in range(10))
+
+
+def test_token_bucket_waits_for_refill():
+    async def acquire():
+        # 6000 per minute refill 100 per second
+        bucket = TokenBucket(6000)
+        await bucket.acquire(6000)
+        start = time.monotonic()
+        await bucket.acquire(10)
+        return time.monotonic() - start
+
+    assert 0.08 <= asyncio.run(acquire()) < 1.0
+
+
+def test_token_bucket_caps_requests_larger_than_its_capacity():
+    async def acquire():
+        bucket = TokenBucket(60)
+        await bucket.acquire(1000)
+        return bucket.available
+
+    assert asyncio.run(acquire()) == pytest.approx(0, abs=0.1)
+
+
+class StubAPIHandler(http.server.BaseHTTPRequestHandler):
+    """Answers chat completions with the next scripted (status, headers, delay)."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        server = self.server
+        with server.lock:
+            server.requests.append((time.monotonic(), self.client_address[1]))
+            status, headers, delay = (
+                server.script.pop(0) if server.script else (200, {}, 0)
+            )
+        time.sleep(delay)
+        if status == 200:
+            body = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "stub",
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": "Stub review"},
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": 7,
+                    "completion_tokens": 2,
+                    "total_tokens": 9,
+                },
+            }
+        else:
+            body = {"error": {"message": "Injected error", "type": "stub"}}
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_api(monkeypatch):
+    """A local OpenAI-compatible server; append to its `script` to inject errors."""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubAPIHandler)
+    server.lock = threading.Lock()
+    server.script = []
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def complete_through_the_stub(requests, max_connections=2, max_retries=3):
+    """Sends requests through the client and request layer of a real run."""
+
+    async def complete():
+        backend = OpenAIBackend(create_client("test-key", max_connections))
+        layer = RequestLayer(
+            retry_policy=RetryPolicy(max_retries=max_retries, base_delay=0.05)
+        )
+        delays = []
+        try:
+            completions = [
+                await layer.call(
+                    lambda: backend.complete(MESSAGES, "stub", 0),
+                    on_retry=lambda error, delay: delays.append(
+                        (error.status_code, delay)
+                    ),
+                )
+                for _ in range(requests)
+            ]
+        finally:
+            await backend.close()
+        return completions, delays
+
+    return asyncio.run(complete())
+
+
+def test_the_server_retry_after_is_honored_over_http(stub_api):
+    stub_api.script += [
+        (429, {"retry-after-ms": "300"}, 0),
+        (429, {"retry-after": "0.2"}, 0),
+        (503, {}, 0),
+        (200, {}, 0.1),
+    ]
+    completions, delays = complete_through_the_stub(1)
+    assert completions[0].content == "Stub review"
+    assert completions[0].prompt_tokens == 7
+    assert [status for status, _ in delays] == [429, 429, 503]
+    assert [delay for _, delay in delays[:2]] == [0.3, 0.2]
+    times = [at for at, _ in stub_api.requests]
+    assert times[1] - times[0] >= 0.3
+    assert times[2] - times[1] >= 0.2
+
+
+def test_retries_are_exhausted_over_http(stub_api):
+    stub_api.script += [(429, {"retry-after-ms": "10"}, 0)] * 3
+    with pytest.raises(openai.RateLimitError):
+        complete_through_the_stub(1, max_retries=2)
+    assert len(stub_api.requests) == 3
+
+
+def test_connections_are_reused(stub_api):
+    complete_through_the_stub(5)
+    assert len(stub_api.requests) == 5
+    assert len({port for _, port in stub_api.requests}) == 1
@@ -0,0 +1,109 @@
+import time
+
+import pytest
+
+import review_cache
+from review_cache import ReviewCache, make_key, normalize_source
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "cache.sqlite3")
+
+
+def test_normalize_source_ignores_line_endings_and_trailing_whitespace():
+    assert normalize_source("a  \r\nb\t\rc\n\n") == normalize_source("a\nb\nc")
+    assert normalize_source("  a") != normalize_source("a")
+
+
+def test_make_key_depends_on_every_part():
+    base = ("source", "system", "1", "gpt-4", 0)
+    keys = {make_key(*base)}
+    for index, value in enumerate(["other", "prompt", "2", "gpt-4o", 0.5]):
+        parts = list(base)
+        parts[index] = value
+        keys.add(make_key(*parts))
+    assert len(keys) == 6
+    assert make_key("source  \n", *base[1:]) == make_key(*base)
+
+
+def test_get_and_put(cache_path):
+    cache = ReviewCache(cache_path)
+    assert cache.get("key") is None
+    cache.put("key", "review")
+    assert cache.get("key") == "review"
+    assert cache.stats() == {"hits": 1, "misses": 1, "stores": 1, "evictions": 0}
+
+
+def test_reviews_persist_once_flushed(cache_path):
+    cache = ReviewCache(cache_path)
+    cache.put("key", "review")
+    cache.close()
+    assert ReviewCache(cache_path).get("key") == "review"
+
+
+def test_refresh_skips_lookups_but_stores(cache_path):
+    ReviewCache(cache_path).close()
+    cache = ReviewCache(cache_path, refresh=True)
+    cache.put("key", "new")
+    assert cache.get("key") is None
+    cache.close()
+    assert ReviewCache(cache_path).get("key") == "new"
+
+
+def test_expired_reviews_are_not_reused(cache_path, monkeypatch):
+    cache = ReviewCache(cache_path, max_age_days=1)
+    cache.put("key", "review")
+    cache.close()
+    now = time.time()
+    monkeypatch.setattr(review_cache.time, "time", lambda: now + 2 * 24 * 60 * 60)
+    reopened = ReviewCache(cache_path, max_age_days=1)
+    assert reopened.evictions == 1
+    assert reopened.total_bytes == 0
+    assert reopened.get("key") is None
+
+
+def test_least_recently_used_reviews_are_evicted(cache_path, monkeypatch):
+    clock = iter(range(1_000_000, 2_000_000))
+    monkeypatch.setattr(review_cache.time, "time", lambda: next(clock))
+    cache = ReviewCache(cache_path, max_bytes=25)
+    cache.put("a", "x" * 10)
+    cache.put("b", "x" * 10)
+    assert cache.get("a") is not None
+    cache.put("c", "x" * 10)
+    cache.flush()
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.evictions == 1
+    assert cache.total_bytes == 20
+
+
+def test_replacing_a_review_keeps_the_size_total(cache_path):
+    cache = ReviewCache(cache_path)
+    cache.put("key", "x" * 100)
+    cache.put("key", "x" * 10)
+    assert cache.total_bytes == 10
+    cache.close()
+    assert ReviewCache(cache_path).total_bytes == 10
+
+
+def test_many_puts_stay_fast(cache_path):
+    cache = ReviewCache(cache_path, max_bytes=100_000)
+    start = time.perf_counter()
+    for index in range(5000):
+        cache.put(f"key-{index}", "x" * 100)
+    cache.close()
+    assert time.perf_counter() - start < 5
+    assert ReviewCache(cache_path).total_bytes <= 100_000
+
+
+def test_caches_sharing_a_file_do_not_lock_each_other(cache_path):
+    first = ReviewCache(cache_path)
+    first.put("a", "review")
+    second = ReviewCache(cache_path)
+    second.put("b", "review")
+    second.flush()
+    first.flush()
+    assert first.get("b") == "review" and second.get("a") == "review"
+    first.close()
+    second.close()
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import logging
+import time
+
+from code_review import ReviewerFactory
+from review_cache import ReviewCache
+from review_client import submit
+from review_daemon import PollingWatcher, ReviewDaemon, file_signature
+
+MODEL = "gpt-4o"
+
+
+def create_daemon(backend, cache=None):
+    factory = ReviewerFactory(backend, cache=cache)
+    return ReviewDaemon(
+        factory, MODEL, 4, factory.supported_extensions(), logging.getLogger(__name__)
+    )
+
+
+def test_watcher_reports_changes_once_they_settle(tmp_path):
+    path = tmp_path / "a.py"
+    path.write_text("x = 1\n")
+    watcher = PollingWatcher(tmp_path, lambda root: sorted(root.glob("*.py")), 0.1)
+    assert watcher.poll() == []
+    path.write_text("x = 2\n")
+    assert watcher.poll() == []
+    time.sleep(0.15)
+    assert watcher.poll() == [path]
+    assert watcher.poll() == []
+
+
+def test_watcher_forgets_files_deleted_before_they_settle(tmp_path):
+    watcher = PollingWatcher(tmp_path, lambda root: sorted(root.glob("*.py")), 0.1)
+    path = tmp_path / "a.py"
+    path.write_text("x = 1\n")
+    assert watcher.poll() == []
+    path.unlink()
+    time.sleep(0.15)
+    assert watcher.poll() == []
+
+
+def test_file_signature(tmp_path):
+    path = tmp_path / "a.py"
+    assert file_signature(path) is None
+    path.write_text("x = 1\n")
+    assert file_signature(path)[1] == 6
+
+
+def test_requests_for_unchanged_content_share_one_review(tmp_path, fake_backend):
+    path = tmp_path / "a.py"
+    path.write_text("x = 1\n")
+
+    async def review():
+        daemon = create_daemon(fake_backend)
+        first, second = daemon.review(path), daemon.review(path)
+        assert first is second
+        await first
+        assert daemon.in_flight == {}
+
+    asyncio.run(review())
+    assert len(fake_backend.requests) == 1
+
+
+def test_a_change_during_a_review_queues_one_follow_up(tmp_path, fake_backend):
+    path = tmp_path / "a.py"
+    path.write_text("x = 1\n")
+
+    async def review():
+        daemon = create_daemon(fake_backend)
+        running = daemon.review(path)
+        await asyncio.sleep(0.01)
+        path.write_text("x = 2\nx = 3\n")
+        follow_up = daemon.review(path)
+        assert follow_up is not running
+        assert daemon.review(path) is follow_up
+        await running
+        await asyncio.sleep(0.01)
+        # The follow-up has read the file, so it covers the current content
+        assert daemon.review(path) is follow_up
+        return await follow_up
+
+    assert asyncio.run(review()) is not None
+    assert len(fake_backend.requests) == 2
+
+
+def test_serve_answers_review_requests(tmp_path, fake_backend):
+    path = tmp_path / "a.py"
+    path.write_text("x = 1\n")
+    socket_path = str(tmp_path / "review.sock")
+
+    async def serve_and_submit():
+        daemon = create_daemon(fake_backend)
+        server = asyncio.create_task(daemon.serve(socket_path))
+        while not (tmp_path / "review.sock").exists():
+            await asyncio.sleep(0.01)
+        responses = await asyncio.to_thread(
+            lambda: list(
+                submit(socket_path, [path, tmp_path / "b.txt", tmp_path / "c.py"])
+            )
+        )
+        server.cancel()
+        return responses
+
+    (tmp_path / "b.txt").write_text("text")
+    responses = asyncio.run(serve_and_submit())
+    assert responses[0]["ok"] and responses[0]["file"] == str(path)
+    assert responses[0]["review"]
+    assert responses[1] == {
+        "file": str(tmp_path / "b.txt"),
+        "ok": False,
+        "error": "Unsupported file type: .txt",
+    }
+    assert not responses[2]["ok"]
+    assert not (tmp_path / "review.sock").exists()
+
+
+def test_invalid_requests(fake_backend):
+    async def handle(line):
+        return await create_daemon(fake_backend).handle_request(line)
+
+    assert not asyncio.run(handle(b"not json\n"))["ok"]
+    assert not asyncio.run(handle(json.dumps({"path": "a.py"}).encode()))["ok"]
+
+
+def test_reviews_are_flushed_to_the_cache(tmp_path, fake_backend):
+    path = tmp_path / "a.py"
+    path.write_text("x = 1\n")
+    cache_path = str(tmp_path / "cache.sqlite3")
+    cache = ReviewCache(cache_path)
+
+    async def review():
+        await create_daemon(fake_backend, cache).review(path)
+        # Another run opens the same cache while the daemon idles
+        other = ReviewCache(cache_path)
+        assert other.total_bytes > 0
+        other.close()
+
+    asyncio.run(review())
+    cache.close()
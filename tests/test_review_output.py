@@ -0,0 +1,108 @@
+import json
+
+from review_output import (
+    GENERAL_CATEGORY,
+    JsonLinesWriter,
+    SarifWriter,
+    create_writer,
+    display_path,
+    split_findings,
+)
+
+
+def test_split_findings_reads_the_json_block():
+    review = (
+        "The review text.\n"
+        "```json\n"
+        + json.dumps(
+            [
+                {
+                    "start_line": 12,
+                    "end_line": 3,
+                    "category": "security vulnerabilities",
+                    "severity": "HIGH",
+                    "suggestion": " Escape the input. ",
+                },
+                {"start_line": "x", "severity": "urgent", "suggestion": "Rename."},
+                {"start_line": 1, "suggestion": ""},
+            ]
+        )
+        + "\n```\nClosing words."
+    )
+    text, findings = split_findings(review, "app.py")
+    assert "```json" not in text
+    assert text.startswith("The review text.") and text.endswith("Closing words.")
+    assert [
+        (f.file, f.start_line, f.end_line, f.category, f.severity, f.suggestion)
+        for f in findings
+    ] == [
+        ("app.py", 12, 12, "Security Vulnerabilities", "high", "Escape the input."),
+        ("app.py", None, None, GENERAL_CATEGORY, "low", "Rename."),
+    ]
+
+
+def test_split_findings_falls_back_to_review_sections():
+    review = (
+        "1. **Code Efficiency**: The loop on lines 4-6 is quadratic.\n"
+        "2. **Testing and Coverage**: Add tests.\n"
+    )
+    text, findings = split_findings(review, "app.py")
+    assert text == review
+    assert [(f.category, f.start_line, f.end_line) for f in findings] == [
+        ("Code Efficiency", 4, 6),
+        ("Testing and Coverage", None, None),
+    ]
+
+
+def test_invalid_json_blocks_are_left_in_the_text():
+    review = "Text\n```json\nnot json\n```"
+    text, findings = split_findings(review, "app.py")
+    assert text == review
+    assert findings == []
+
+
+def test_json_lines_writer(tmp_path):
+    _, findings = split_findings(
+        '```json\n[{"start_line": 1, "suggestion": "Fix."}]\n```', "app.py"
+    )
+    path = tmp_path / "findings.jsonl"
+    with JsonLinesWriter(path) as writer:
+        writer.write(findings)
+        writer.write(findings)
+    lines = path.read_text().splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0])["suggestion"] == "Fix."
+
+
+def test_sarif_writer_produces_a_valid_log(tmp_path):
+    _, findings = split_findings(
+        "```json\n"
+        '[{"start_line": 2, "end_line": 4, "severity": "medium", "suggestion": "A"},'
+        ' {"suggestion": "B"}]\n```',
+        "app.py",
+    )
+    path = tmp_path / "review.sarif"
+    with SarifWriter(path) as writer:
+        writer.write(findings[:1])
+        writer.write(findings[1:])
+    log = json.loads(path.read_text())
+    results = log["runs"][0]["results"]
+    assert [result["level"] for result in results] == ["warning", "note"]
+    region = results[0]["locations"][0]["physicalLocation"]["region"]
+    assert region == {"startLine": 2, "endLine": 4}
+    assert "region" not in results[1]["locations"][0]["physicalLocation"]
+
+
+def test_create_writer_guesses_the_format(tmp_path):
+    with create_writer(tmp_path / "out.sarif.json") as writer:
+        assert isinstance(writer, SarifWriter)
+    with create_writer(tmp_path / "out.txt") as writer:
+        assert isinstance(writer, JsonLinesWriter)
+    with create_writer(tmp_path / "out.txt", "sarif") as writer:
+        assert isinstance(writer, SarifWriter)
+
+
+def test_display_path_is_relative_below_the_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert display_path(tmp_path / "src" / "app.py") == "src/app.py"
+    assert display_path("/elsewhere/app.py") == "/elsewhere/app.py"
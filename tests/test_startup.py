@@ -0,0 +1,13 @@
+from benchmarks.startup_benchmark import DEFERRED_MODULES, import_times
+
+
+def test_heavy_modules_are_not_imported_at_startup():
+    times = import_times("code_review")
+    assert "code_review" in times
+    assert [module for module in DEFERRED_MODULES if module in times] == []
+
+
+def test_import_times_sees_nested_imports():
+    # request_layer imports httpx itself, so it must show up as deferred
+    times = import_times("request_layer")
+    assert "httpx" in times
@@ -0,0 +1,33 @@
+import asyncio
+
+from streaming import LineBuffer, StreamStats, consume_stream
+
+
+def test_line_buffer_emits_complete_lines():
+    lines = []
+    buffer = LineBuffer(lines.append)
+    buffer.write("first li")
+    buffer.write("ne\nsecond\nthi")
+    assert lines == ["first line", "second"]
+    buffer.flush()
+    buffer.flush()
+    assert lines == ["first line", "second", "thi"]
+
+
+def test_consume_stream_measures_the_first_token():
+    async def deltas():
+        await asyncio.sleep(0.05)
+        for text in ["a ", "", "b\n", "c"]:
+            yield text
+
+    lines = []
+    text, stats = asyncio.run(consume_stream(deltas(), lines.append))
+    assert text == "a b\nc"
+    assert lines == ["a b", "c"]
+    assert stats.tokens == 3
+    assert 0.05 <= stats.time_to_first_token <= stats.total_latency
+
+
+def test_tokens_per_second_excludes_the_wait_for_the_first_token():
+    assert StreamStats(1.0, 3.0, 10).tokens_per_second == 5.0
+    assert StreamStats(1.0, 1.0, 10).tokens_per_second == 0.0
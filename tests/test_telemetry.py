@@ -0,0 +1,94 @@
+import json
+import math
+
+import pytest
+
+from telemetry import (
+    Histogram,
+    RequestMetrics,
+    Telemetry,
+    escape_label,
+    prices_for_model,
+)
+
+
+def test_prices_match_the_longest_prefix():
+    assert prices_for_model("gpt-4o-mini-2024-07-18") == (0.15, 0.6)
+    assert prices_for_model("gpt-4o-2024-05-13") == (5.0, 15.0)
+    assert prices_for_model("unknown") is None
+
+
+def test_escape_label():
+    assert escape_label('a"b\\c\nd') == 'a\\"b\\\\c\\nd'
+
+
+def test_histogram():
+    histogram = Histogram((1, 2, 5))
+    for value in (0.5, 0.5, 1.5, 4, 10):
+        histogram.observe(value)
+    assert histogram.cumulative_counts() == [(1, 2), (2, 3), (5, 4), (math.inf, 5)]
+    assert histogram.quantile(0.5) == 2
+    assert histogram.quantile(1.0) == 10
+    assert Histogram((1,)).quantile(0.5) == 0.0
+    other = Histogram((1, 2, 5))
+    other.observe(0.1)
+    histogram.merge(other)
+    assert histogram.count == 6 and histogram.counts[0] == 3
+
+
+def test_record_request_splits_packed_requests():
+    telemetry = Telemetry(prices=(1.0, 2.0))
+    metrics = RequestMetrics(prompt_tokens=1000, completion_tokens=500, latency=1.5)
+    telemetry.record_request(["a.py", "b.py"], "python", "model", metrics)
+    telemetry.record_cache_hit("c.py", "python")
+    assert telemetry.files["a.py"].prompt_tokens == 500
+    assert telemetry.files["a.py"].cost == pytest.approx(0.001)
+    totals = telemetry.totals()
+    assert (totals.requests, totals.cache_hits, totals.prompt_tokens) == (1, 1, 1000)
+    assert totals.cost == pytest.approx(0.002)
+    assert telemetry.unpriced_models == set()
+
+
+def test_failed_requests_are_counted_but_not_billed():
+    telemetry = Telemetry()
+    metrics = RequestMetrics(prompt_tokens=1000, retries=5, failed=True)
+    telemetry.record_request(["a.py"], "python", "gpt-4o", metrics)
+    totals = telemetry.totals()
+    assert (totals.requests, totals.failures, totals.retries) == (1, 1, 5)
+    assert totals.cost == 0.0
+
+
+def test_unknown_models_are_reported():
+    telemetry = Telemetry()
+    telemetry.record_request(["a.py"], "python", "local", RequestMetrics(10, 10))
+    assert telemetry.unpriced_models == {"local"}
+    assert telemetry.totals().cost == 0.0
+
+
+def test_exports(tmp_path):
+    telemetry = Telemetry(labels={"repository": "repo"})
+    telemetry.record_request(
+        ["a.py"], "python", "gpt-4o", RequestMetrics(100, 10, latency=0.7)
+    )
+    path = tmp_path / "metrics.prom"
+    telemetry.write_prometheus(path)
+    text = path.read_text()
+    assert 'refactormind_requests_total{repository="repo",language="python"} 1' in text
+    assert (
+        'refactormind_model_prompt_tokens_total{repository="repo",model="gpt-4o"} 100'
+        in text
+    )
+    assert (
+        'refactormind_request_latency_seconds_bucket{repository="repo",'
+        'language="python",le="1"} 1'
+    ) in text
+    assert "a.py" not in text
+
+    telemetry.write_json(tmp_path / "metrics.json")
+    summary = json.loads((tmp_path / "metrics.json").read_text())
+    assert summary["files"]["a.py"]["prompt_tokens"] == 100
+    assert summary["languages"]["python"]["latency_seconds"]["count"] == 1
+
+    table = telemetry.table().splitlines()
+    assert table[0].split()[:3] == ["language", "requests", "failed"]
+    assert table[-1].split()[:2] == ["total", "1"]